@@ -2,12 +2,16 @@
 API endpoints for retrieving poker statistics.
 """
 import logging
-from typing import Dict, List, Any, Optional
-from fastapi import FastAPI, Depends, HTTPException
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, Hashable, List, Any, Optional
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import desc, exists, func, select, true
 
-from backend.storage.database import Database, Hand, Player, Action, Winner
+from backend.storage.database import (
+    Database, Hand, HandFile, HandParticipant, Player, Action, ActionType, PotWinner, Street
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -15,129 +19,232 @@ logger = logging.getLogger(__name__)
 # Create FastAPI app
 app = FastAPI(title="Poker Hud API", description="API for poker statistics")
 
+# Action types that put money in the pot, and the aggressive subset of them
+INVESTING_ACTIONS = (ActionType.CALL, ActionType.BET, ActionType.RAISE)
+AGGRESSIVE_ACTIONS = (ActionType.BET, ActionType.RAISE)
+
+# Maximum number of cached responses
+RESPONSE_CACHE_SIZE = 512
+
+# Responses keyed by (endpoint key, hands version), least recently used first
+_response_cache: "OrderedDict[Hashable, Any]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+# Database manager shared by all requests; sessions come from its connection pool
+_db = Database()
+
+
 # Database dependency
 def get_db():
-    db = Database()
-    session = db.get_session()
+    session = _db.get_session()
     try:
         yield session
     finally:
-        db.close_session(session)
+        _db.close_session(session)
+
+
+def get_hands_version(db: Session) -> str:
+    """
+    Get a version string for the stored hand data.
+
+    Hand data only changes when a hand history file is processed, which always
+    adds or updates a HandFile record, so the version is derived from those
+    records. This works across processes, e.g. when the collector and the API
+    server run separately.
+
+    Args:
+        db: Database session.
+
+    Returns:
+        Version string that changes whenever hand history files are processed.
+    """
+    file_count, last_processed = db.execute(
+        select(func.count(HandFile.id), func.max(HandFile.processed_at))
+    ).one()
+    return f"{file_count}-{last_processed.isoformat() if last_processed else 0}"
+
+
+def cached_response(key: Hashable, version: str, compute: Callable[[], Any]) -> Any:
+    """
+    Return a cached response for a key and hands version, computing it on a miss.
+
+    Args:
+        key: Key identifying the endpoint and its arguments.
+        version: Current hands version, see get_hands_version.
+        compute: Function that builds the response.
+
+    Returns:
+        The cached or newly computed response.
+    """
+    cache_key = (key, version)
+    with _response_cache_lock:
+        if cache_key in _response_cache:
+            _response_cache.move_to_end(cache_key)
+            return _response_cache[cache_key]
+
+    result = compute()
+
+    with _response_cache_lock:
+        _response_cache[cache_key] = result
+        while len(_response_cache) > RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+    return result
 
 
 @app.get("/api/players")
-def get_players(db: Session = Depends(get_db)):
+def get_players(request: Request, response: Response, db: Session = Depends(get_db)):
     """
     Get a list of all players in the database.
     """
     try:
+        version = get_hands_version(db)
+        etag = f'W/"{version}-players"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+
         # Get unique player names
-        players = db.query(Player.name).distinct().all()
-        return {"players": [player[0] for player in players]}
+        def list_players():
+            players = db.query(Player.name).distinct().all()
+            return {"players": [player[0] for player in players]}
+
+        return cached_response("players", version, list_players)
     except Exception as e:
         logger.error(f"Error getting players: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/player/{player_name}/stats")
-def get_player_stats(player_name: str, db: Session = Depends(get_db)):
+def _compute_player_stats(player_name: str, db: Session) -> Dict[str, Any]:
     """
-    Get statistics for a specific player.
+    Compute the statistics returned by get_player_stats.
     """
-    try:
-        # Count total hands played
-        hands_played = db.query(func.count(Player.id)).filter(Player.name == player_name).scalar() or 0
-
-        if hands_played == 0:
-            raise HTTPException(status_code=404, detail=f"Player {player_name} not found")
-
-        # Calculate win rate
-        hands_won = db.query(func.count(Winner.id)).filter(Winner.player_name == player_name).scalar() or 0
-        win_rate = (hands_won / hands_played) * 100 if hands_played > 0 else 0
-
-        # Calculate total winnings
-        total_winnings = db.query(func.sum(Winner.amount)).filter(Winner.player_name == player_name).scalar() or 0
-
-        # Calculate average stack
-        avg_stack = db.query(func.avg(Player.stack)).filter(Player.name == player_name).scalar() or 0
-
-        # Calculate VPIP (Voluntarily Put Money In Pot)
-        vpip_actions = db.query(func.count(Action.id)).filter(
-            Action.player.has(name=player_name),
-            Action.street == "preflop",
-            Action.action_type.in_(["call", "bet", "raise"])
-        ).scalar() or 0
+    # Count the player's actions for VPIP, PFR and AF in a single pass over their
+    # actions, rather than one index scan per counter
+    preflop = Action.street_code == Street.PREFLOP
+    action_counts = (
+        select(
+            # VPIP (Voluntarily Put Money In Pot)
+            func.count(Action.id).filter(preflop, Action.action_type_code.in_(INVESTING_ACTIONS)).label("vpip_actions"),
+            # PFR (Pre-Flop Raise)
+            func.count(Action.id).filter(preflop, Action.action_type_code == ActionType.RAISE).label("pfr_actions"),
+            # AF (Aggression Factor)
+            func.count(Action.id).filter(Action.action_type_code.in_(AGGRESSIVE_ACTIONS)).label("aggressive_actions"),
+            func.count(Action.id).filter(Action.action_type_code == ActionType.CALL).label("passive_actions"),
+        )
+        .join(Player, Action.player_id == Player.id)
+        .where(Player.name == player_name)
+        .subquery()
+    )
 
-        vpip = (vpip_actions / hands_played) * 100 if hands_played > 0 else 0
+    # Compute every other counter in the same query, using correlated subqueries
+    # on the (indexed) player and participant foreign keys
+    stats = db.execute(
+        select(
+            select(func.count(HandParticipant.id))
+            .where(HandParticipant.player_id == Player.id)
+            .scalar_subquery().label("hands_played"),
+            select(func.count(HandParticipant.id))
+            .where(
+                HandParticipant.player_id == Player.id,
+                exists().where(PotWinner.participant_id == HandParticipant.id)
+            )
+            .scalar_subquery().label("hands_won"),
+            select(func.sum(PotWinner.amount))
+            .join(HandParticipant, PotWinner.participant_id == HandParticipant.id)
+            .where(HandParticipant.player_id == Player.id)
+            .scalar_subquery().label("total_winnings"),
+            select(func.avg(HandParticipant.stack))
+            .where(HandParticipant.player_id == Player.id)
+            .scalar_subquery().label("avg_stack"),
+            action_counts,
+        )
+        # action_counts is a single row, so it is joined to the player unconditionally
+        .select_from(Player).join(action_counts, true())
+        .where(Player.name == player_name)
+    ).first()
 
-        # Calculate PFR (Pre-Flop Raise)
-        pfr_actions = db.query(func.count(Action.id)).filter(
-            Action.player.has(name=player_name),
-            Action.street == "preflop",
-            Action.action_type == "raise"
-        ).scalar() or 0
+    hands_played = stats.hands_played if stats else 0
 
-        pfr = (pfr_actions / hands_played) * 100 if hands_played > 0 else 0
+    if hands_played == 0:
+        raise HTTPException(status_code=404, detail=f"Player {player_name} not found")
 
-        # Calculate AF (Aggression Factor)
-        aggressive_actions = db.query(func.count(Action.id)).filter(
-            Action.player.has(name=player_name),
-            Action.action_type.in_(["bet", "raise"])
-        ).scalar() or 0
+    # Calculate win rate
+    hands_won = stats.hands_won or 0
+    win_rate = (hands_won / hands_played) * 100 if hands_played > 0 else 0
 
-        passive_actions = db.query(func.count(Action.id)).filter(
-            Action.player.has(name=player_name),
-            Action.action_type == "call"
-        ).scalar() or 0
+    total_winnings = stats.total_winnings or 0
+    avg_stack = stats.avg_stack or 0
 
-        af = aggressive_actions / passive_actions if passive_actions > 0 else 0
+    vpip = (stats.vpip_actions / hands_played) * 100 if hands_played > 0 else 0
+    pfr = (stats.pfr_actions / hands_played) * 100 if hands_played > 0 else 0
+    af = stats.aggressive_actions / stats.passive_actions if stats.passive_actions > 0 else 0
 
-        # Get recent hands
-        recent_hands = db.query(Hand).join(Player).filter(
-            Player.name == player_name
-        ).order_by(desc(Hand.date_time)).limit(10).all()
+    # Get recent hands, with the player's winnings and money invested in each
+    # hand aggregated per participant by the database
+    hand_winnings = select(func.sum(PotWinner.amount)).where(
+        PotWinner.participant_id == HandParticipant.id
+    ).scalar_subquery()
+    money_invested = select(func.sum(Action.amount)).where(
+        Action.participant_id == HandParticipant.id,
+        Action.action_type_code.in_(INVESTING_ACTIONS)
+    ).scalar_subquery()
+    recent_hands = db.execute(
+        select(
+            Hand.hand_id,
+            Hand.date_time,
+            Hand.pot,
+            hand_winnings.label("winnings"),
+            money_invested.label("money_invested"),
+        )
+        .join(HandParticipant, HandParticipant.hand_id == Hand.id)
+        .join(Player, HandParticipant.player_id == Player.id)
+        .where(Player.name == player_name)
+        .order_by(desc(Hand.date_time))
+        .limit(10)
+    ).all()
 
-        recent_results = []
-        for hand in recent_hands:
-            # Check if player won this hand
-            won = any(winner.player_name == player_name for winner in hand.winners)
+    recent_results = []
+    for hand in recent_hands:
+        # Calculate profit/loss for this hand
+        profit = (hand.winnings or 0) - (hand.money_invested or 0)
 
-            # Calculate profit/loss for this hand
-            profit = 0
-            for winner in hand.winners:
-                if winner.player_name == player_name:
-                    profit += winner.amount
+        recent_results.append({
+            "hand_id": hand.hand_id,
+            "date_time": hand.date_time.isoformat(),
+            "won": hand.winnings is not None,
+            "profit": profit,
+            "pot": hand.pot
+        })
 
-            # Find player's actions in this hand
-            player_actions = [action for action in hand.actions
-                             if action.player.name == player_name]
+    return {
+        "player_name": player_name,
+        "hands_played": hands_played,
+        "hands_won": hands_won,
+        "win_rate": win_rate,
+        "total_winnings": total_winnings,
+        "avg_stack": avg_stack,
+        "vpip": vpip,
+        "pfr": pfr,
+        "af": af,
+        "recent_results": recent_results
+    }
 
-            # Calculate money invested
-            money_invested = sum(action.amount or 0 for action in player_actions
-                               if action.action_type in ["call", "bet", "raise"])
 
-            profit -= money_invested
+@app.get("/api/player/{player_name}/stats")
+def get_player_stats(player_name: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    """
+    Get statistics for a specific player.
+    """
+    try:
+        version = get_hands_version(db)
+        etag = f'W/"{version}-{player_name}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
 
-            recent_results.append({
-                "hand_id": hand.hand_id,
-                "date_time": hand.date_time.isoformat(),
-                "won": won,
-                "profit": profit,
-                "pot": hand.pot
-            })
-
-        return {
-            "player_name": player_name,
-            "hands_played": hands_played,
-            "hands_won": hands_won,
-            "win_rate": win_rate,
-            "total_winnings": total_winnings,
-            "avg_stack": avg_stack,
-            "vpip": vpip,
-            "pfr": pfr,
-            "af": af,
-            "recent_results": recent_results
-        }
+        return cached_response(
+            ("player_stats", player_name), version, lambda: _compute_player_stats(player_name, db)
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -151,7 +258,33 @@ def get_recent_hands(limit: int = 10, db: Session = Depends(get_db)):
     Get the most recent hands.
     """
     try:
-        hands = db.query(Hand).order_by(desc(Hand.date_time)).limit(limit).all()
+        hands = db.execute(
+            select(Hand.id, Hand.hand_id, Hand.date_time, Hand.game_type, Hand.pot)
+            .order_by(desc(Hand.date_time))
+            .limit(limit)
+        ).all()
+        hand_ids = [hand.id for hand in hands]
+
+        # Load the players and winners of all the hands with one query each,
+        # rather than lazy loading them hand by hand
+        players = defaultdict(list)
+        for hand_id, player_name in db.execute(
+            select(HandParticipant.hand_id, Player.name)
+            .join(Player, HandParticipant.player_id == Player.id)
+            .where(HandParticipant.hand_id.in_(hand_ids))
+            .order_by(HandParticipant.hand_id, HandParticipant.seat)
+        ):
+            players[hand_id].append(player_name)
+
+        winners = defaultdict(list)
+        for hand_id, player_name, amount in db.execute(
+            select(HandParticipant.hand_id, Player.name, func.sum(PotWinner.amount))
+            .join(HandParticipant, PotWinner.participant_id == HandParticipant.id)
+            .join(Player, HandParticipant.player_id == Player.id)
+            .where(HandParticipant.hand_id.in_(hand_ids))
+            .group_by(HandParticipant.hand_id, Player.name)
+        ):
+            winners[hand_id].append({"player": player_name, "amount": amount})
 
         result = []
         for hand in hands:
@@ -160,8 +293,8 @@ def get_recent_hands(limit: int = 10, db: Session = Depends(get_db)):
                 "date_time": hand.date_time.isoformat(),
                 "game_type": hand.game_type,
                 "pot": hand.pot,
-                "players": [player.name for player in hand.players],
-                "winners": [{"player": winner.player_name, "amount": winner.amount} for winner in hand.winners]
+                "players": players[hand.id],
+                "winners": winners[hand.id]
             }
             result.append(hand_data)
 
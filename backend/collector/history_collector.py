@@ -3,13 +3,18 @@ Hand history collector module for monitoring and syncing PokerStars hand history
 """
 import os
 import logging
+import signal
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
-from typing import List, Optional, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
 from datetime import datetime
-import time
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler, FileCreatedEvent, FileModifiedEvent
 from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
 
 from backend.parser.hand_parser import HandParser
 from backend.storage.database import Database
@@ -24,6 +29,34 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Seconds to wait after the last change to a file before processing it
+MODIFIED_DEBOUNCE_SECONDS = 0.5
+
+# Number of parsed files stored per transaction when syncing the history directory
+SYNC_FILE_BATCH_SIZE = 50
+
+
+def _parse_history_file(file_path: Path) -> Tuple[Path, List[Dict[str, Any]], int, Optional[Exception]]:
+    """
+    Parse a hand history file, capturing any error instead of raising it.
+
+    Defined at module level so it can be sent to worker processes.
+
+    Args:
+        file_path: Path to the hand history file.
+
+    Returns:
+        Tuple of the file path, the parsed hands, the byte offset up to which the
+        file was parsed and the error raised while parsing (if any).
+    """
+    try:
+        # Only complete hands are parsed; a hand still being written is left for process_appended_hands
+        parser = HandParser()
+        last_offset = parser.complete_hands_end(file_path)
+        return file_path, parser.parse_file(file_path, last_offset), last_offset, None
+    except Exception as e:
+        return file_path, [], 0, e
+
 
 class HandHistoryCollector:
     """
@@ -47,24 +80,33 @@ class HandHistoryCollector:
 
         self.processed_files: Set[str] = set()
         self.observer: Optional[Observer] = None
+        self.event_handler: Optional[HandHistoryEventHandler] = None
         self.parser = HandParser()
         self.database = Database()
 
-        # Load already processed files from database
+        # Make sure the schema is up to date, then load already processed files from database
+        self.database.create_tables()
         self._load_processed_files()
 
         logger.info(f"Hand history collector initialized with path: {self.history_path}")
 
     def _load_processed_files(self) -> None:
         """
-        Load the list of already processed files from the database.
+        Load the already processed files of the history directory from the database.
+
+        Only paths inside the history directory are read, as a range scan on the
+        unique file_path index, so files recorded for other directories are skipped.
         """
         session = self.database.get_session()
         try:
             from backend.storage.database import HandFile
-            processed_files = session.query(HandFile.file_path).all()
-            for file_path, in processed_files:
-                self.processed_files.add(file_path)
+            directory = str(self.history_path)
+            # Every path in the directory sorts between "<directory>/" and "<directory>0"
+            lower = os.path.join(directory, '')
+            upper = directory + chr(ord(os.sep) + 1)
+            self.processed_files = set(session.scalars(
+                select(HandFile.file_path).where(HandFile.file_path >= lower, HandFile.file_path < upper)
+            ))
             logger.info(f"Loaded {len(self.processed_files)} processed files from database")
         except Exception as e:
             logger.error(f"Error loading processed files: {e}")
@@ -78,8 +120,25 @@ class HandHistoryCollector:
         Returns:
             List of Path objects for all hand history files.
         """
+        return [Path(path) for path in self._history_file_paths()]
+
+    def _history_file_paths(self) -> List[str]:
+        """
+        Get the paths of all hand history files in the configured directory, sorted by name.
+
+        Uses os.scandir so the file type comes from the directory listing itself
+        rather than an extra stat call per file.
+
+        Returns:
+            List of file path strings.
+        """
         # PokerStars hand history files typically have a .txt extension
-        return sorted(self.history_path.glob("*.txt"))
+        with os.scandir(self.history_path) as entries:
+            return [
+                entry.path
+                for entry in sorted(entries, key=lambda entry: entry.name)
+                if entry.name.endswith('.txt') and entry.is_file(follow_symlinks=False)
+            ]
 
     def process_file(self, file_path: Path) -> None:
         """
@@ -90,41 +149,31 @@ class HandHistoryCollector:
         """
         file_path_str = str(file_path)
 
-        # Check if the file has already been processed successfully
+        # Check if the file has already been processed successfully. The set is
+        # loaded from the database at startup and kept up to date afterwards, so
+        # there is no need to query the database here
         if file_path_str in self.processed_files:
-            logger.debug(f"File already processed (in memory): {file_path}")
+            logger.debug(f"File already processed: {file_path}")
             return
-            
-        # Check database for file processing status
-        from backend.storage.database import HandFile
-        session = self.database.get_session()
-        try:
-            file_record = session.query(HandFile).filter(HandFile.file_path == file_path_str).first()
-            if file_record and file_record.status == "processed" and file_record.hand_count > 0:
-                logger.debug(f"File already processed successfully (in database): {file_path}")
-                self.processed_files.add(file_path_str)  # Add to in-memory cache
-                return
-            elif file_record:
-                # File exists in database but had errors or no hands - we'll reprocess it
-                logger.info(f"Reprocessing file with previous status '{file_record.status}': {file_path}")
-        finally:
-            self.database.close_session(session)
 
         # Process the file without excessive logging
         try:
-            # Parse the file
-            hands = self.parser.parse_file(file_path)
+            # Only the complete hands are stored, like appended hands are; the rest of
+            # the file, including a hand still being written, is picked up by process_appended_hands
+            last_offset = self.parser.complete_hands_end(file_path)
+            
+            # Parse the file and store the hands in the database
+            hand_count, added_count = self._store_file_hands(file_path, last_offset)
             
-            if not hands:
+            if not hand_count:
                 logger.info(f"No hands found in file: {file_path.name}")
-                self.database.mark_file_processed(file_path_str, 0, "no_hands", "No hands found in file")
+                self.database.mark_file_processed(
+                    file_path_str, 0, "no_hands", "No hands found in file", last_offset=last_offset
+                )
                 return
-                
-            # Store the hands in the database
-            self.database.store_hands(hands)
             
             # Mark as successfully processed
-            self.database.mark_file_processed(file_path_str, len(hands), "processed")
+            self.database.mark_file_processed(file_path_str, added_count, "processed", last_offset=last_offset)
             self.processed_files.add(file_path_str)
         except Exception as e:
             logger.error(f"Error processing file {file_path}: {e}")
@@ -132,6 +181,60 @@ class HandHistoryCollector:
             # This ensures we'll try to process it again next time
             self.database.mark_file_processed(file_path_str, 0, "error", str(e))
 
+    def process_appended_hands(self, file_path: Path) -> None:
+        """
+        Process the hands appended to a hand history file since it was last processed.
+
+        Only the data after the stored byte offset is parsed, so a file that is
+        being written to during a session isn't re-parsed from the start each time.
+        Files that haven't been processed yet are processed up to their last complete hand.
+
+        Args:
+            file_path: Path to the hand history file.
+        """
+        file_path_str = str(file_path)
+        if file_path_str not in self.processed_files:
+            self.process_file(file_path)
+            return
+
+        try:
+            offset = self.database.get_file_offset(file_path_str) or 0
+            hands, last_offset = self.parser.parse_appended_hands(file_path, offset)
+            if last_offset == offset:
+                return
+
+            # Count only the hands actually added: records from before offsets were
+            # stored have none, so their first append re-parses hands already stored
+            added_count = 0
+            if hands:
+                _, added_count = self.database.store_hands_stream(hands)
+            self.database.record_appended_hands(file_path_str, added_count, last_offset)
+        except Exception as e:
+            logger.error(f"Error processing new hands in file {file_path}: {e}")
+
+    def _store_file_hands(self, file_path: Path, end: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Parse a hand history file and store its hands in the database.
+
+        Hands are streamed from the parser into a single transaction, so the whole
+        file is never held in memory. If storing fails, the file is re-parsed and
+        stored hand by hand, so one bad hand doesn't prevent the rest from being stored.
+
+        Args:
+            file_path: Path to the hand history file.
+            end: Byte offset to stop parsing at (optional).
+
+        Returns:
+            Tuple of the number of hands parsed from the file and the number of
+            hands added to the database.
+        """
+        try:
+            return self.database.store_hands_stream(self.parser.parse_file_iter(file_path, end))
+        except SQLAlchemyError as e:
+            logger.warning(f"Error storing hands from {file_path.name}, storing them one by one: {e}")
+            hands = self.parser.parse_file(file_path, end)
+            return len(hands), self.database.store_hands(hands)
+
     def sync_history_files(self) -> int:
         """
         Sync all hand history files in the configured directory.
@@ -139,22 +242,75 @@ class HandHistoryCollector:
         Returns:
             Number of files processed.
         """
-        files = self.get_history_files()
-        count = 0
-
-        # Process only unprocessed files
-        unprocessed_files = [f for f in files if str(f) not in self.processed_files]
+        # Process only unprocessed files, skipping known paths before building Path objects
+        unprocessed_files = [
+            Path(path) for path in self._history_file_paths() if path not in self.processed_files
+        ]
         
-        if unprocessed_files:
-            logger.info(f"Found {len(unprocessed_files)} unprocessed hand history files")
-            
-            for file_path in unprocessed_files:
-                self.process_file(file_path)
-                count += 1
-        else:
+        if not unprocessed_files:
             logger.info("No new hand history files to process")
+            return 0
+
+        logger.info(f"Found {len(unprocessed_files)} unprocessed hand history files")
+
+        # Parse the files in worker processes, since parsing is CPU bound and threads
+        # would be serialized by the GIL. Storing stays in this process, and each
+        # file's hands are stored as they arrive while the workers parse the next
+        # files. Only a few files per worker are submitted ahead, so parsed hands
+        # don't pile up in this process faster than they are stored.
+        workers = min(len(unprocessed_files), os.cpu_count() or 1)
+        remaining_files = iter(unprocessed_files)
+        parsed_files = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = {
+                executor.submit(_parse_history_file, file_path)
+                for file_path in islice(remaining_files, workers * 2)
+            }
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path, hands, last_offset, error = future.result()
+                    if error is not None:
+                        logger.error(f"Error processing file {file_path}: {error}")
+                        # Mark as error in database but DO NOT add to processed_files set
+                        self.database.mark_file_processed(str(file_path), 0, "error", str(error))
+                    else:
+                        parsed_files.append((str(file_path), hands, last_offset))
+                    
+                    next_file = next(remaining_files, None)
+                    if next_file is not None:
+                        pending.add(executor.submit(_parse_history_file, next_file))
+                
+                if len(parsed_files) >= SYNC_FILE_BATCH_SIZE:
+                    self._store_parsed_files(parsed_files)
+                    parsed_files = []
+        
+        self._store_parsed_files(parsed_files)
 
-        return count
+        return len(unprocessed_files)
+
+    def _store_parsed_files(self, parsed_files: List[Tuple[str, List[Dict[str, Any]], int]]) -> None:
+        """
+        Store a batch of parsed hand history files in a single transaction.
+
+        If storing the batch fails, only its files are processed again one by one.
+
+        Args:
+            parsed_files: List of (file path, parsed hands, parsed byte offset) tuples.
+        """
+        if not parsed_files:
+            return
+        
+        try:
+            self.database.store_hands_bulk(parsed_files)
+        except Exception as e:
+            logger.error(f"Error storing hand history files in bulk, processing them one by one: {e}")
+            for file_path, _, _ in parsed_files:
+                self.process_file(Path(file_path))
+        else:
+            for file_path, hands, _ in parsed_files:
+                if hands:
+                    self.processed_files.add(file_path)
 
     def start_monitoring(self) -> None:
         """
@@ -167,13 +323,16 @@ class HandHistoryCollector:
         # First, sync existing files
         self.sync_history_files()
 
-        # Set up the file system event handler
-        event_handler = HandHistoryEventHandler(self)
+        # Set up the file system event handler. watchdog picks the native backend
+        # for the platform (inotify on Linux, FSEvents on macOS), which reads
+        # events from the kernel in batches rather than polling the directory
+        self.event_handler = HandHistoryEventHandler(self)
         self.observer = Observer()
-        self.observer.schedule(event_handler, str(self.history_path), recursive=False)
+        self.observer.schedule(self.event_handler, str(self.history_path), recursive=False)
         self.observer.start()
 
-        logger.info(f"Started monitoring hand history directory: {self.history_path}")
+        logger.info(f"Started monitoring hand history directory: {self.history_path} "
+                    f"(using {type(self.observer).__name__})")
 
     def stop_monitoring(self) -> None:
         """
@@ -183,12 +342,20 @@ class HandHistoryCollector:
             self.observer.stop()
             self.observer.join()
             self.observer = None
+            self.event_handler.cancel_pending()
+            self.event_handler = None
             logger.info("Stopped monitoring hand history directory")
 
 
 class HandHistoryEventHandler(FileSystemEventHandler):
     """
     Event handler for hand history file changes.
+
+    PokerStars writes to the file of an active session several times per hand,
+    so events are coalesced per file: a file is only processed once no further
+    events have arrived for it for MODIFIED_DEBOUNCE_SECONDS. Only one run at a
+    time processes a given file; a timer that fires while the file is still being
+    processed waits for that run to finish.
     """
     def __init__(self, collector: HandHistoryCollector):
         """
@@ -198,6 +365,9 @@ class HandHistoryEventHandler(FileSystemEventHandler):
             collector: The hand history collector instance.
         """
         self.collector = collector
+        self._pending: Dict[str, threading.Timer] = {}
+        self._path_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
 
     def on_created(self, event):
         """
@@ -208,7 +378,7 @@ class HandHistoryEventHandler(FileSystemEventHandler):
         """
         if not event.is_directory and event.src_path.endswith('.txt'):
             logger.info(f"New hand history file detected: {event.src_path}")
-            self.collector.process_file(Path(event.src_path))
+            self._schedule(event.src_path)
 
     def on_modified(self, event):
         """
@@ -218,8 +388,53 @@ class HandHistoryEventHandler(FileSystemEventHandler):
             event: The file system event.
         """
         if not event.is_directory and event.src_path.endswith('.txt'):
-            logger.info(f"Hand history file modified: {event.src_path}")
-            self.collector.process_file(Path(event.src_path))
+            logger.debug(f"Hand history file modified: {event.src_path}")
+            self._schedule(event.src_path)
+
+    def cancel_pending(self):
+        """
+        Cancel any scheduled processing that hasn't started yet.
+        """
+        with self._lock:
+            for timer in self._pending.values():
+                timer.cancel()
+            self._pending.clear()
+
+    def _schedule(self, path: str):
+        """
+        (Re)start the debounce timer for a file.
+
+        Args:
+            path: Path of the changed file.
+        """
+        with self._lock:
+            timer = self._pending.get(path)
+            if timer:
+                timer.cancel()
+            timer = threading.Timer(MODIFIED_DEBOUNCE_SECONDS, self._process, args=(path,))
+            timer.daemon = True
+            self._pending[path] = timer
+            timer.start()
+
+    def _process(self, path: str):
+        """
+        Process the new hands in a file once its debounce timer fires.
+
+        Args:
+            path: Path of the changed file.
+        """
+        with self._lock:
+            # A newer event may already have replaced this timer
+            if self._pending.get(path) is threading.current_thread():
+                del self._pending[path]
+            path_lock = self._path_locks.setdefault(path, threading.Lock())
+        
+        # Two runs on the same file would parse and store the same hands from the
+        # same offset, so wait for a run that is still going; this one then starts
+        # from the offset that run recorded
+        with path_lock:
+            logger.info(f"Processing changes to hand history file: {path}")
+            self.collector.process_appended_hands(Path(path))
 
 
 def main():
@@ -237,12 +452,13 @@ def main():
         # Start monitoring for new files
         collector.start_monitoring()
 
-        # Keep the script running
+        # Keep the script running until Ctrl+C or a termination signal sets the stop event
+        stop_event = threading.Event()
+        signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+        signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
         try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            logger.info("Keyboard interrupt received, stopping...")
+            stop_event.wait()
+            logger.info("Shutdown signal received, stopping...")
         finally:
             collector.stop_monitoring()
 
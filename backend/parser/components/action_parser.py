@@ -16,19 +16,19 @@ class PlayerActionParser(BaseParser):
     """
     
     # Patterns for blinds and antes
-    ANTE_PATTERN = re.compile(r"(.*?): posts the ante (\d+)")
-    SMALL_BLIND_PATTERN = re.compile(r"(.*?): posts small blind (\d+)")
-    BIG_BLIND_PATTERN = re.compile(r"(.*?): posts big blind (\d+)")
+    ANTE_PATTERN = re.compile(r"^(.*?): posts the ante (\d+)")
+    SMALL_BLIND_PATTERN = re.compile(r"^(.*?): posts small blind (\d+)")
+    BIG_BLIND_PATTERN = re.compile(r"^(.*?): posts big blind (\d+)")
     
     # Patterns for player actions
     ACTION_PATTERNS = {
-        'fold': re.compile(r"(.*?): folds"),
-        'check': re.compile(r"(.*?): checks"),
-        'call': re.compile(r"(.*?): calls \$?([\d,]+(?:\.\d+)?)"),
-        'bet': re.compile(r"(.*?): bets \$?([\d,]+(?:\.\d+)?)"),
-        'raise': re.compile(r"(.*?): raises \$?([\d,]+(?:\.\d+)?) to \$?([\d,]+(?:\.\d+)?)"),
+        'fold': re.compile(r"^(.*?): folds"),
+        'check': re.compile(r"^(.*?): checks"),
+        'call': re.compile(r"^(.*?): calls \$?([\d,]+(?:\.\d+)?)"),
+        'bet': re.compile(r"^(.*?): bets \$?([\d,]+(?:\.\d+)?)"),
+        'raise': re.compile(r"^(.*?): raises \$?([\d,]+(?:\.\d+)?) to \$?([\d,]+(?:\.\d+)?)"),
         # Separate pattern for detecting all-in actions
-        'all-in': re.compile(r"(.*?): (calls|bets|raises) \$?([\d,]+(?:\.\d+)?)(?:.* to \$?([\d,]+(?:\.\d+)?))?.*and is all-in"),
+        'all-in': re.compile(r"^(.*?): (calls|bets|raises) \$?([\d,]+(?:\.\d+)?)(?:.* to \$?([\d,]+(?:\.\d+)?))?.*and is all-in"),
     }
     
     def __init__(self):
@@ -24,7 +24,7 @@ class PlayerParser(BaseParser):
     HOLE_CARDS_PATTERN = re.compile(r"Dealt to (.*?) \[(.*?)\]")
     
     # Pattern for showdown
-    SHOWDOWN_PATTERN = re.compile(r"(.*?): shows \[(.*?)\]")
+    SHOWDOWN_PATTERN = re.compile(r"^(.*?): shows \[(.*?)\]")
     
     def __init__(self):
         """Initialize the player parser component."""
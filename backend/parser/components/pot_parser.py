@@ -26,7 +26,7 @@ class PotParser(BaseParser):
     # This handles both formats:
     # 1. "Player collected X from pot" (simple case)
     # 2. "Player collected X from main pot" or "Player collected X from side pot-1" (specific pot case)
-    WINNER_PATTERN = re.compile(r"(.*?) collected \$?([\d,]+(?:\.\d+)?) from (?:(main|side)(?: pot)?(?:-(\d+))?|pot)")
+    WINNER_PATTERN = re.compile(r"^(.*?) collected \$?([\d,]+(?:\.\d+)?) from (?:(main|side)(?: pot)?(?:-(\d+))?|pot)")
     
     # Pattern for uncalled bets
     # This handles both formats:
@@ -38,7 +38,7 @@ class PotParser(BaseParser):
     # This handles both formats:
     # 1. "Player collected 100 from pot"
     # 2. "Player collected (100) from pot" (with parentheses)
-    POT_COLLECTION_PATTERN = re.compile(r"(.*?) collected \(?\$?([\d,]+(?:\.\d+)?)\)? from pot")
+    POT_COLLECTION_PATTERN = re.compile(r"^(.*?) collected \(?\$?([\d,]+(?:\.\d+)?)\)? from pot")
     
     # Pattern for board cards
     BOARD_PATTERN = re.compile(r"Board \[(.*?)\]")
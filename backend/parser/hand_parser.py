@@ -1,14 +1,19 @@
 """
 Parser for PokerStars hand history files.
 """
+import io
+import os
 import re
 import logging
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Any, Tuple
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Bytes read at a time from the end of a file when looking for the last hand separator
+TAIL_READ_SIZE = 64 * 1024
+
 
 class HandParser:
     """
@@ -26,10 +31,14 @@ class HandParser:
         r"(.*?) \[(\d{4}/\d{2}/\d{2}) (\d{1,2}:\d{2}:\d{2}) (?:ET|UTC|WET)(?:.*)\]"  # Game type, date, time
     )
     
+    # Patterns that start with a lazy "(.*?)" are anchored to the start of the line.
+    # A match always starts there anyway, and without the anchor every line that
+    # doesn't match is rescanned from each position (quadratic in the line length)
+    
     # Patterns for blinds and antes
-    ANTE_PATTERN = re.compile(r"(.*?): posts the ante (\d+)")
-    SMALL_BLIND_PATTERN = re.compile(r"(.*?): posts small blind (\d+)")
-    BIG_BLIND_PATTERN = re.compile(r"(.*?): posts big blind (\d+)")
+    ANTE_PATTERN = re.compile(r"^(.*?): posts the ante (\d+)")
+    SMALL_BLIND_PATTERN = re.compile(r"^(.*?): posts small blind (\d+)")
+    BIG_BLIND_PATTERN = re.compile(r"^(.*?): posts big blind (\d+)")
     
     # Pattern for player information with seat number and stack
     PLAYER_PATTERN = re.compile(
@@ -40,34 +49,37 @@ class HandParser:
     TABLE_PATTERN = re.compile(r"Table '([^']+)' (\d+)-max Seat #(\d+) is the button")
     
     ACTION_PATTERNS = {
-        'fold': re.compile(r"(.*?): folds"),
-        'check': re.compile(r"(.*?): checks"),
-        'call': re.compile(r"(.*?): calls \$?([\d,]+(?:\.\d+)?)"),
-        'bet': re.compile(r"(.*?): bets \$?([\d,]+(?:\.\d+)?)"),
-        'raise': re.compile(r"(.*?): raises \$?([\d,]+(?:\.\d+)?) to \$?([\d,]+(?:\.\d+)?)"),
-        'all-in': re.compile(r"(.*?): (calls|bets|raises) \$?([\d,]+(?:\.\d+)?)(?:.* to \$?([\d,]+(?:\.\d+)?))?(?:.* and is all-in)"),
+        'fold': re.compile(r"^(.*?): folds"),
+        'check': re.compile(r"^(.*?): checks"),
+        'call': re.compile(r"^(.*?): calls \$?([\d,]+(?:\.\d+)?)"),
+        'bet': re.compile(r"^(.*?): bets \$?([\d,]+(?:\.\d+)?)"),
+        'raise': re.compile(r"^(.*?): raises \$?([\d,]+(?:\.\d+)?) to \$?([\d,]+(?:\.\d+)?)"),
+        'all-in': re.compile(r"^(.*?): (calls|bets|raises) \$?([\d,]+(?:\.\d+)?)(?:.* to \$?([\d,]+(?:\.\d+)?))?(?:.* and is all-in)"),
     }
     
     # Updated pattern to handle different summary formats including side pots
     SUMMARY_PATTERN = re.compile(r"Total pot \$?([\d,]+(?:\.\d+)?)(?:\s*Main pot \$?([\d,]+(?:\.\d+)?)\.?(?:\s*Side pot(?:-\d+)? \$?([\d,]+(?:\.\d+)?)\.?)?(?:\s*Side pot(?:-\d+)? \$?([\d,]+(?:\.\d+)?)\.?)?(?:\s*Side pot(?:-\d+)? \$?([\d,]+(?:\.\d+)?)\.?)?(?:\s*Side pot(?:-\d+)? \$?([\d,]+(?:\.\d+)?)\.?)?(?:\s*Side pot(?:-\d+)? \$?([\d,]+(?:\.\d+)?)\.?)?(?:\s*Side pot(?:-\d+)? \$?([\d,]+(?:\.\d+)?)\.?)?(?:\s*Side pot(?:-\d+)? \$?([\d,]+(?:\.\d+)?)\.?)?)?(?:\s*\|\s*Rake \$?([\d,]+(?:\.\d+)?))?")
     
     # Pattern for winners from specific pots
-    WINNER_PATTERN = re.compile(r"(.*?) collected \$?([\d,]+(?:\.\d+)?) from (?:(main|side)(?: pot)?(?:-(\d+))?|pot)")
+    WINNER_PATTERN = re.compile(r"^(.*?) collected \$?([\d,]+(?:\.\d+)?) from (?:(main|side)(?: pot)?(?:-(\d+))?|pot)")
     
-    SHOWDOWN_PATTERN = re.compile(r"(.*?): shows \[(.*?)\]")
+    SHOWDOWN_PATTERN = re.compile(r"^(.*?): shows \[(.*?)\]")
     
     BOARD_PATTERN = re.compile(r"Board \[(.*?)\]")
     
+    DEALT_PATTERN = re.compile(r"Dealt to (.*?) \[(.*?)\]")
+    
     def __init__(self):
         """Initialize the hand parser."""
         pass
     
-    def parse_file(self, file_path: Path) -> List[Dict[str, Any]]:
+    def parse_file(self, file_path: Path, end: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Parse a hand history file into a list of structured hand data.
         
         Args:
             file_path: Path to the hand history file.
+            end: Byte offset to stop parsing at, as returned by complete_hands_end (optional).
             
         Returns:
             List of dictionaries containing structured hand data.
@@ -75,48 +87,196 @@ class HandParser:
         Raises:
             Exception: If there is an error parsing the file or if no hands were successfully parsed.
         """
-        logger.info(f"Parsing hand history file: {file_path}")
+        return list(self.parse_file_iter(file_path, end))
+    
+    def parse_file_iter(self, file_path: Path, end: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Parse a hand history file, yielding structured hand data one hand at a time.
         
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
+        The file is read line by line, so only the hand currently being parsed is
+        held in memory.
+        
+        Args:
+            file_path: Path to the hand history file.
+            end: Byte offset to stop parsing at, as returned by complete_hands_end, so
+                 a hand that is still being written isn't parsed (optional).
             
-            # Split the content into individual hands
-            # PokerStars hands are separated by blank lines
-            hand_texts = re.split(r'\n\n+', content)
+        Yields:
+            Dictionaries containing structured hand data.
             
-            hands = []
+        Raises:
+            Exception: If there is an error parsing the file or if no hands were successfully parsed.
+        """
+        logger.info(f"Parsing hand history file: {file_path}")
+        
+        try:
+            hand_count = 0
             errors = []
-            for i, hand_text in enumerate(hand_texts):
-                if not hand_text.strip():
-                    continue
-                
-                try:
-                    hand_data = self.parse_hand(hand_text)
+            with open(file_path, 'rb') as file:
+                lines = io.TextIOWrapper(file, encoding='utf-8') if end is None else self._iter_lines_until(file, end)
+                for i, hand_text in enumerate(self._iter_hand_texts(lines)):
+                    try:
+                        hand_data = self.parse_hand(hand_text)
+                    except Exception as e:
+                        error_msg = f"Error parsing hand #{i+1}: {str(e)}"
+                        logger.error(error_msg)
+                        errors.append(error_msg)
+                        continue
+                    
                     if hand_data:
-                        hands.append(hand_data)
-                except Exception as e:
-                    error_msg = f"Error parsing hand #{i+1}: {str(e)}"
-                    logger.error(error_msg)
-                    errors.append(error_msg)
+                        hand_count += 1
+                        yield hand_data
             
             # Log the results
-            logger.info(f"Parsed {len(hands)} hands from file: {file_path}")
+            logger.info(f"Parsed {hand_count} hands from file: {file_path}")
             
             # If we didn't parse any hands successfully and had errors, raise an exception
-            if len(hands) == 0 and errors:
+            if hand_count == 0 and errors:
                 error_summary = "\n".join(errors[:5])
                 if len(errors) > 5:
                     error_summary += f"\n...and {len(errors) - 5} more errors"
                 raise Exception(f"Failed to parse any hands from file. Errors: {error_summary}")
-                
-            return hands
             
         except Exception as e:
             logger.error(f"Error parsing file {file_path}: {e}")
             # Re-raise the exception to be handled by the caller
             raise
     
+    def parse_appended_hands(self, file_path: Path, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Parse the complete hands written to a hand history file after a byte offset.
+        
+        PokerStars appends to the file of an active session, so only the data up to
+        the last blank line is parsed; a hand that is still being written is left
+        for the next call. If the file is now shorter than the offset (it was
+        rewritten), it is parsed from the start.
+        
+        Args:
+            file_path: Path to the hand history file.
+            offset: Byte offset up to which the file has already been parsed.
+            
+        Returns:
+            Tuple of the parsed hands and the byte offset up to which the file has now been parsed.
+        """
+        with open(file_path, 'rb') as file:
+            if offset > os.fstat(file.fileno()).st_size:
+                offset = 0
+            file.seek(offset)
+            data = file.read()
+        
+        end = self._separator_end(data)
+        if end == 0:
+            return [], offset
+        
+        # Decode with universal newlines, like the text mode reads in parse_file
+        text = io.StringIO(data[:end].decode('utf-8'), newline=None)
+        hands = []
+        for i, hand_text in enumerate(self._iter_hand_texts(text)):
+            try:
+                hand_data = self.parse_hand(hand_text)
+            except Exception as e:
+                logger.error(f"Error parsing appended hand #{i+1} in {file_path}: {e}")
+                continue
+            if hand_data:
+                hands.append(hand_data)
+        
+        logger.info(f"Parsed {len(hands)} new hands from file: {file_path}")
+        return hands, offset + end
+    
+    def complete_hands_end(self, file_path: Path) -> int:
+        """
+        Find the byte offset up to which a hand history file holds complete hands.
+        
+        A hand is complete once the blank line after it has been written, so this is
+        the end of the last blank line. The file is read backwards from its end, a
+        block at a time, until one is found.
+        
+        Args:
+            file_path: Path to the hand history file.
+            
+        Returns:
+            Byte offset just after the last blank line, or 0 if there is none yet.
+        """
+        with open(file_path, 'rb') as file:
+            position = os.fstat(file.fileno()).st_size
+            # Keep the first bytes of the previous block, so a separator split between blocks is found
+            tail = b''
+            while position > 0:
+                start = max(position - TAIL_READ_SIZE, 0)
+                file.seek(start)
+                data = file.read(position - start) + tail
+                end = self._separator_end(data)
+                if end:
+                    return start + end
+                tail = data[:2]
+                position = start
+        return 0
+    
+    @staticmethod
+    def _separator_end(data: bytes) -> int:
+        """
+        Find the end of the last blank line separating hands in hand history data.
+        
+        Args:
+            data: Raw hand history data.
+            
+        Returns:
+            Offset just after the last blank line in data, or 0 if there is none.
+        """
+        return max(
+            data.rfind(b'\n\n') + 2 if b'\n\n' in data else 0,
+            data.rfind(b'\n\r\n') + 3 if b'\n\r\n' in data else 0,
+        )
+    
+    @staticmethod
+    def _iter_lines_until(file: BinaryIO, end: int) -> Iterator[str]:
+        """
+        Read the lines of a binary file up to a byte offset.
+        
+        Windows line endings are converted to newlines, as text mode does when whole files are read.
+        
+        Args:
+            file: Hand history file opened in binary mode.
+            end: Byte offset to stop reading at.
+            
+        Yields:
+            Each line, ending with a newline unless it is cut off at the offset.
+        """
+        remaining = end
+        for line in file:
+            if remaining <= 0:
+                break
+            line = line[:remaining]
+            remaining -= len(line)
+            yield line.decode('utf-8').replace('\r\n', '\n')
+    
+    @staticmethod
+    def _iter_hand_texts(lines: Iterable[str]) -> Iterator[str]:
+        """
+        Split hand history lines into the text of individual hands.
+        
+        PokerStars hands are separated by blank lines.
+        
+        Args:
+            lines: Lines of a hand history file.
+            
+        Yields:
+            The text of each hand, without the separating blank lines.
+        """
+        hand_lines = []
+        for line in lines:
+            if line == '\n':
+                if hand_lines:
+                    yield ''.join(hand_lines).rstrip('\n')
+                    hand_lines = []
+            else:
+                hand_lines.append(line)
+        
+        if hand_lines:
+            text = ''.join(hand_lines)
+            if text.strip():
+                yield text
+    
     def parse_hand(self, hand_text: str) -> Optional[Dict[str, Any]]:
         """
         Parse a single hand history text into structured data.
@@ -393,7 +553,7 @@ class HandParser:
                     break  # Only one action per line
             
             # Parse hole cards
-            dealt_match = re.search(r"Dealt to (.*?) \[(.*?)\]", line)
+            dealt_match = self.DEALT_PATTERN.search(line)
             if dealt_match:
                 player_name = dealt_match.group(1)
                 cards = dealt_match.group(2).split()
@@ -6,9 +6,11 @@ This module provides database models and utilities for storing and retrieving po
 """
 import logging
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import create_engine, insert, inspect, select, text, Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship, Session
 
 import os
@@ -33,11 +35,6 @@ if not DATABASE_URL or DATABASE_URL.strip() == '':
     DATABASE_URL = f'sqlite:///{PROJECT_ROOT}/poker_hud.db'
     print(f"DATABASE_URL was empty, using default: {DATABASE_URL}")
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 # SQLAlchemy setup
@@ -51,6 +48,7 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    labels_hash = Column(String(16), nullable=True)  # Hash of the last imported label set
     
     # Relationships
     labels = relationship("Label", back_populates="user", cascade="all, delete-orphan")
@@ -82,13 +80,84 @@ class Note(Base):
     external_label_id = Column(Integer, nullable=True)  # Original label ID from XML
     player_name = Column(String, index=True)
     content = Column(Text)
-    last_updated = Column(DateTime)
+    last_updated = Column(Integer, index=True)  # Unix timestamp from the XML "update" attribute
     source_file = Column(String)  # Original XML file
     
     # Relationships
     user = relationship("User", back_populates="notes")
     label = relationship("Label", back_populates="notes")
 
+    @property
+    def last_updated_dt(self) -> Optional[datetime]:
+        """Last update time as a local datetime, converted only when accessed."""
+        if self.last_updated is None:
+            return None
+        return datetime.fromtimestamp(self.last_updated)
+
+
+def migrate_note_timestamps(engine: Engine) -> None:
+    """
+    Convert note timestamps stored as DATETIME strings by older versions to Unix timestamps.
+    
+    The strings were written from local datetimes, so they are converted back to UTC epochs.
+    Rows that already hold integers are left untouched.
+    
+    Args:
+        engine: Database engine.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    
+    with engine.begin() as conn:
+        result = conn.execute(text(
+            "UPDATE notes SET last_updated = CAST(strftime('%s', last_updated, 'utc') AS INTEGER) "
+            "WHERE typeof(last_updated) = 'text'"
+        ))
+        if result.rowcount:
+            logger.info(f"Converted {result.rowcount} note timestamps to Unix timestamps")
+
+
+def migrate_database(engine: Engine) -> None:
+    """
+    Bring an existing database up to date with the current models.
+    
+    Adds columns introduced after the tables were first created and converts
+    legacy note timestamps.
+    
+    Args:
+        engine: Database engine.
+    """
+    user_columns = [column["name"] for column in inspect(engine).get_columns("users")]
+    if "labels_hash" not in user_columns:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE users ADD COLUMN labels_hash VARCHAR(16)"))
+        logger.info("Added labels_hash column to users table")
+    
+    migrate_note_timestamps(engine)
+
+
+@lru_cache(maxsize=16)
+def _get_session_maker(database_url: str) -> sessionmaker:
+    """
+    Create the engine and session maker for a database URL.
+    
+    Results are cached per URL, so the engine (and its connection pool) is only
+    built once and the schema is only checked and migrated once per process.
+    
+    Args:
+        database_url: The database URL to connect to.
+        
+    Returns:
+        Session maker bound to the engine for the URL.
+    """
+    engine = create_engine(database_url)
+    
+    # Create tables if they don't exist
+    Base.metadata.create_all(bind=engine)
+    migrate_database(engine)
+    
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
 
 def get_database_session(database_url: str = None) -> Tuple[Session, sessionmaker]:
     """
@@ -109,12 +178,8 @@ def get_database_session(database_url: str = None) -> Tuple[Session, sessionmake
         database_url = f'sqlite:///{PROJECT_ROOT}/poker_hud.db'
         print(f"Using fallback database URL: {database_url}")
     
-    # Create the engine and session
-    engine = create_engine(database_url)
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    
-    # Create tables if they don't exist
-    Base.metadata.create_all(bind=engine)
+    # Reuse the engine and session maker for this URL
+    SessionLocal = _get_session_maker(database_url)
     
     return SessionLocal(), SessionLocal
 
@@ -137,3 +202,26 @@ def get_or_create_user(session: Session, username: str) -> User:
         session.commit()
         logger.info(f"Created new user: {username}")
     return user
+
+
+def get_or_create_user_id(session: Session, username: str) -> int:
+    """
+    Get the ID of an existing user, creating the user if needed.
+    
+    Only the ID column is selected (using the unique index on username), so no
+    User object is loaded into the session.
+    
+    Args:
+        session: Database session.
+        username: Username.
+        
+    Returns:
+        User ID.
+    """
+    user_id = session.execute(select(User.id).where(User.username == username)).scalar()
+    if user_id is None:
+        result = session.execute(insert(User).values(username=username))
+        user_id = result.inserted_primary_key[0]
+        session.commit()
+        logger.info(f"Created new user: {username}")
+    return user_id
@@ -9,23 +9,25 @@ import argparse
 import logging
 import os
 import sys
+from itertools import chain
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 # Handle imports for both module and direct script usage
 try:
     # When imported as a module
     from ..config import DATABASE_URL
-    from .db_utils import get_database_session, get_or_create_user, Label, Note
-    from .xml_utils import generate_xml, write_xml_to_file
+    from .db_utils import get_database_session, get_or_create_user_id, Label, Note
+    from .xml_utils import export_notes_stream
 except ImportError:
     # When run as a script
     sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
     from backend.config import DATABASE_URL
-    from backend.poker_notes.db_utils import get_database_session, get_or_create_user, Label, Note
-    from backend.poker_notes.xml_utils import generate_xml, write_xml_to_file
+    from backend.poker_notes.db_utils import get_database_session, get_or_create_user_id, Label, Note
+    from backend.poker_notes.xml_utils import export_notes_stream
 
 # Configure logging
 logging.basicConfig(
@@ -37,8 +39,40 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Number of note rows fetched from the database per round trip during export
+NOTES_BATCH_SIZE = 1000
 
-def get_user_notes_and_labels(session: Session, username: str) -> Tuple[List[Dict], List[Dict]]:
+
+def iter_user_notes(session: Session, user_id: int) -> Iterator[Dict]:
+    """
+    Stream the notes for a user without loading them all into memory.
+
+    Only the columns needed for export are selected, so no Note objects are
+    constructed and rows are fetched from the database in batches.
+
+    Args:
+        session: Database session.
+        user_id: User ID.
+
+    Yields:
+        Note dictionaries in the format expected by export_notes_stream.
+    """
+    result = session.execute(
+        select(Note.player_name, Note.external_label_id, Note.last_updated, Note.content)
+        .where(Note.user_id == user_id)
+        .execution_options(yield_per=NOTES_BATCH_SIZE)
+    )
+
+    for player_name, label_id, last_updated, content in result:
+        yield {
+            "player_name": player_name,
+            "label_id": label_id,
+            "content": content,
+            "last_updated": last_updated
+        }
+
+
+def get_user_notes_and_labels(session: Session, username: str) -> Tuple[Iterator[Dict], List[Dict]]:
     """
     Get all notes and labels for a user.
     
@@ -47,38 +81,33 @@ def get_user_notes_and_labels(session: Session, username: str) -> Tuple[List[Dic
         username: Username.
         
     Returns:
-        Tuple of (notes_list, labels_list).
+        Tuple of (notes_iterator, labels_list). The notes are streamed from the
+        database, so the session must stay open while they are consumed.
     """
     # Get user
-    user = get_or_create_user(session, username)
+    user_id = get_or_create_user_id(session, username)
     
     # Get labels
-    labels_query = session.query(Label).filter(Label.user_id == user.id)
+    labels_result = session.execute(
+        select(Label.external_label_id, Label.color, Label.name).where(Label.user_id == user_id)
+    )
     labels = []
 
-    for label in labels_query:
+    for label_id, color, name in labels_result:
         labels.append({
-            "label_id": label.external_label_id,
-            "color": label.color,
-            "name": label.name
+            "label_id": label_id,
+            "color": color,
+            "name": name
         })
     
     # Get notes
-    notes_query = session.query(Note).filter(Note.user_id == user.id)
-    notes = []
-    
-    for note in notes_query:
-        notes.append({
-            "player_name": note.player_name,
-            "label_id": note.external_label_id,
-            "content": note.content,
-            "last_updated": note.last_updated
-        })
+    notes = iter_user_notes(session, user_id)
     
     return notes, labels
 
 
-def export_notes_to_file(username: str, output_file: str = None, database_url: str = None) -> bool:
+def export_notes_to_file(username: str, output_file: str = None, database_url: str = None,
+                         session: Optional[Session] = None) -> bool:
     """
     Export notes from the database to an XML file.
     
@@ -86,43 +115,45 @@ def export_notes_to_file(username: str, output_file: str = None, database_url: s
         username: Username.
         output_file: Output file path. If None, uses the default format "notes.{username}.xml".
         database_url: Database URL (optional, will use default if not provided).
+        session: Existing database session to use instead of opening a new one (optional).
+                 The caller remains responsible for closing it.
         
     Returns:
         True if successful, False otherwise.
     """
     # Get database session (db_utils will handle empty database_url)
-    session, _ = get_database_session(database_url)
+    owns_session = session is None
+    if owns_session:
+        session, _ = get_database_session(database_url)
     
     try:
         # Get notes and labels
         notes, labels = get_user_notes_and_labels(session, username)
         
-        if not notes:
+        # Look at the first note so that no file is written when there are none
+        first_note = next(notes, None)
+        if first_note is None:
             logger.warning(f"No notes found for user {username}")
             return False
         
-        # Generate XML
-        root = generate_xml(username, labels, notes)
-        
         # Determine output file path
         if not output_file:
             output_file = f"notes.{username}.xml"
         
-        # Write XML to file
-        success = write_xml_to_file(root, output_file)
-        
-        if success:
-            logger.info(f"Exported {len(notes)} notes to {output_file}")
+        # Write the XML, consuming the notes as they are streamed from the database
+        note_count = export_notes_stream(username, labels, chain([first_note], notes), output_file)
+        logger.info(f"Exported {note_count} notes to {output_file}")
         
-        return success
+        return True
         
     except Exception as e:
         logger.error(f"Error exporting notes: {e}")
         return False
         
     finally:
-        # Close session
-        session.close()
+        # Close session if we opened it
+        if owns_session:
+            session.close()
 
 
 def main():
@@ -6,26 +6,33 @@ This script imports poker player notes from multiple XML files and stores them i
 It supports user-based separation to ensure notes from different users don't get mixed up.
 """
 import argparse
+import hashlib
 import logging
 import os
+import stat
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
 
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 
 # Handle imports for both module and direct script usage
 try:
     # When imported as a module
     from ..config import DATABASE_URL
-    from .db_utils import get_database_session, get_or_create_user, Label, Note
-    from .xml_utils import parse_xml_file
+    from .db_utils import get_database_session, get_or_create_user_id, Label, Note, User
+    from .xml_utils import cache_xml_file, get_cached_xml_file, parse_xml_file, parse_xml_file_uncached
 except ImportError:
     # When run as a script
     sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
     from backend.config import DATABASE_URL
-    from backend.poker_notes.db_utils import get_database_session, get_or_create_user, Label, Note
-    from backend.poker_notes.xml_utils import parse_xml_file
+    from backend.poker_notes.db_utils import get_database_session, get_or_create_user_id, Label, Note, User
+    from backend.poker_notes.xml_utils import (
+        cache_xml_file, get_cached_xml_file, parse_xml_file, parse_xml_file_uncached
+    )
 
 # Configure logging
 logging.basicConfig(
@@ -38,7 +45,37 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def import_labels(session: Session, user_id: int, labels_dict: Dict[int, Dict]) -> Dict[int, Label]:
+def labels_hash(labels_dict: Dict[int, Dict]) -> str:
+    """
+    Compute a short hash of a label set, used to detect unchanged labels between imports.
+
+    Args:
+        labels_dict: Dictionary of labels from XML.
+
+    Returns:
+        16 character hex digest.
+    """
+    canonical = repr(sorted((label_id, sorted(data.items())) for label_id, data in labels_dict.items()))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def get_label_map(session: Session, user_id: int) -> Dict[int, int]:
+    """
+    Get the mapping of a user's original label IDs to label primary keys.
+
+    Args:
+        session: Database session.
+        user_id: User ID.
+
+    Returns:
+        Dictionary mapping original label IDs to label primary keys.
+    """
+    return dict(session.execute(
+        select(Label.external_label_id, Label.id).where(Label.user_id == user_id)
+    ).all())
+
+
+def import_labels(session: Session, user_id: int, labels_dict: Dict[int, Dict]) -> Dict[int, int]:
     """
     Import labels into the database.
 
@@ -48,22 +85,23 @@ def import_labels(session: Session, user_id: int, labels_dict: Dict[int, Dict])
         labels_dict: Dictionary of labels from XML.
 
     Returns:
-        Dictionary mapping original label IDs to Label objects.
+        Dictionary mapping original label IDs to label primary keys.
     """
-    label_map = {}
-    
     # Debug: Log the labels being imported
     logger.info(f"Importing labels: {labels_dict}")
 
+    # Load all of the user's existing labels in one query
+    existing_labels = {
+        label.external_label_id: label
+        for label in session.execute(select(Label).where(Label.user_id == user_id)).scalars()
+    }
+
     for xml_label_id, label_data in labels_dict.items():
         # Debug: Log the current label being processed
         logger.info(f"Processing label: id={xml_label_id}, data={label_data}")
         
         # Check if this label already exists for this user
-        existing_label = session.query(Label).filter(
-            Label.user_id == user_id,
-            Label.external_label_id == xml_label_id
-        ).first()
+        existing_label = existing_labels.get(xml_label_id)
 
         if existing_label:
             # Debug: Log existing label details
@@ -84,7 +122,6 @@ def import_labels(session: Session, user_id: int, labels_dict: Dict[int, Dict])
                 existing_label.color = label_data["color"]
 
             session.add(existing_label)
-            label_map[xml_label_id] = existing_label
         else:
             # Create new label
             new_label = Label(
@@ -96,18 +133,21 @@ def import_labels(session: Session, user_id: int, labels_dict: Dict[int, Dict])
             # Debug: Log new label details
             logger.info(f"Creating new label: external_id={xml_label_id}, name={label_data['name']}")
             session.add(new_label)
-            label_map[xml_label_id] = new_label
 
     # Commit changes
     session.commit()
     
+    # Resolve every label's primary key with a single query, so notes can be
+    # linked to labels without touching the (now expired) Label objects
+    label_map = get_label_map(session, user_id)
+    
     # Debug: Log the final label map
-    logger.info(f"Final label map: {[(k, v.id, v.external_label_id, v.name) for k, v in label_map.items()]}")
+    logger.info(f"Final label map: {label_map}")
 
     return label_map
 
 
-def import_notes(session: Session, user_id: int, notes_list: List[Dict], label_map: Dict[int, Label]) -> int:
+def import_notes(session: Session, user_id: int, notes_list: List[Dict], label_map: Dict[int, int]) -> int:
     """
     Import notes into the database.
 
@@ -115,7 +155,7 @@ def import_notes(session: Session, user_id: int, notes_list: List[Dict], label_m
         session: Database session.
         user_id: User ID.
         notes_list: List of notes from XML.
-        label_map: Dictionary mapping original label IDs to Label objects.
+        label_map: Dictionary mapping original label IDs to label primary keys.
 
     Returns:
         Number of notes imported.
@@ -130,15 +170,15 @@ def import_notes(session: Session, user_id: int, notes_list: List[Dict], label_m
         source_file = note_data["source_file"]
 
         # Get label ID from map
-        label_id = None
-        if xml_label_id in label_map:
-            label_id = label_map[xml_label_id].id
+        label_id = label_map.get(xml_label_id)
 
         # Check if this note already exists for this user and player
-        existing_note = session.query(Note).filter(
-            Note.user_id == user_id,
-            Note.player_name == player_name
-        ).first()
+        existing_note = session.execute(
+            select(Note).where(
+                Note.user_id == user_id,
+                Note.player_name == player_name
+            )
+        ).scalars().first()
 
         if existing_note:
             # If the existing note is older or the content is different, update it
@@ -181,39 +221,136 @@ def import_notes(session: Session, user_id: int, notes_list: List[Dict], label_m
     return imported_count
 
 
-def import_notes_from_files(username: str, file_paths: List[str], database_url: str = None) -> int:
+def find_valid_files(file_paths: List[str]) -> Tuple[List[str], List[os.stat_result]]:
     """
-    Import notes from XML files into the database.
+    Keep the paths that are regular files, logging a warning for the others.
+
+    Each file is stat'ed once, and the results are returned so that parsing
+    doesn't have to stat the files again.
+
+    Args:
+        file_paths: List of file paths.
+
+    Returns:
+        Tuple of (valid_file_paths, file_stats), in the same order.
+    """
+    valid_files = []
+    file_stats = []
+    for file_path in file_paths:
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            file_stat = None
+        
+        if file_stat is not None and stat.S_ISREG(file_stat.st_mode):
+            valid_files.append(file_path)
+            file_stats.append(file_stat)
+        else:
+            logger.warning(f"File not found: {file_path}")
+    
+    return valid_files, file_stats
+
+
+def parse_xml_files(file_paths: List[str],
+                    file_stats: Optional[List[os.stat_result]] = None) -> List[Tuple[Dict[int, Dict], List[Dict]]]:
+    """
+    Parse XML notes files, in parallel worker processes when there are several.
+
+    Parsing is CPU bound, so threads wouldn't run it in parallel.
 
     Args:
-        username: Username.
         file_paths: List of paths to XML files.
+        file_stats: Results of os.stat for the files, in the same order (optional).
+
+    Returns:
+        List of (labels_dict, notes_list) tuples, in the same order as file_paths.
+    """
+    if file_stats is None:
+        file_stats = [None] * len(file_paths)
+
+    # The parse cache lives in this process, so cached files are taken from it
+    # and only the others are sent to the short-lived worker processes
+    results = [None] * len(file_paths)
+    misses = []
+    for index, (file_path, file_stat) in enumerate(zip(file_paths, file_stats)):
+        if file_stat is None:
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                # Logs the error and returns no labels or notes
+                results[index] = parse_xml_file(file_path)
+                continue
+        results[index] = get_cached_xml_file(file_path, file_stat)
+        if results[index] is None:
+            misses.append((index, file_path, file_stat))
+
+    if len(misses) < 2:
+        for index, file_path, file_stat in misses:
+            results[index] = parse_xml_file(file_path, file_stat)
+        return results
+
+    # Each process parses one file at a time, so it doesn't also split files across threads
+    with ProcessPoolExecutor(max_workers=min(len(misses), os.cpu_count() or 1)) as executor:
+        parsed = executor.map(
+            partial(parse_xml_file_uncached, threads=False),
+            [file_path for _, file_path, _ in misses],
+            [file_stat.st_size for _, _, file_stat in misses]
+        )
+        for (index, file_path, file_stat), result in zip(misses, parsed):
+            cache_xml_file(file_path, file_stat, result)
+            results[index] = result
+    return results
+
+
+def import_parsed_notes(username: str, parsed_files: List[Tuple[str, Dict[int, Dict], List[Dict]]],
+                        database_url: str = None, session: Optional[Session] = None) -> int:
+    """
+    Import already parsed notes files into the database.
+
+    Files are imported in order, so later files are merged on top of earlier ones.
+
+    Args:
+        username: Username.
+        parsed_files: List of (file_path, labels_dict, notes_list) tuples.
         database_url: Database URL (optional, will use default if not provided).
+        session: Existing database session to use instead of opening a new one (optional).
+                 The caller remains responsible for closing it.
 
     Returns:
         Total number of notes imported.
     """
     # Get database session (db_utils will handle empty database_url)
-    session, _ = get_database_session(database_url)
+    owns_session = session is None
+    if owns_session:
+        session, _ = get_database_session(database_url)
 
     try:
         # Get or create user
-        user = get_or_create_user(session, username)
+        user_id = get_or_create_user_id(session, username)
 
         total_imported = 0
 
         # Process each file
-        for file_path in file_paths:
+        for file_path, labels_dict, notes_list in parsed_files:
             logger.info(f"Processing file: {file_path}")
 
-            # Parse XML file
-            labels_dict, notes_list = parse_xml_file(file_path)
-
-            # Import labels
-            label_map = import_labels(session, user.id, labels_dict)
+            # Import labels, unless they are unchanged since the last import
+            file_labels_hash = labels_hash(labels_dict)
+            stored_labels_hash = session.execute(
+                select(User.labels_hash).where(User.id == user_id)
+            ).scalar()
+            if file_labels_hash == stored_labels_hash:
+                logger.info("Labels unchanged since last import, skipping label sync")
+                label_map = get_label_map(session, user_id)
+            else:
+                label_map = import_labels(session, user_id, labels_dict)
+                session.execute(
+                    update(User).where(User.id == user_id).values(labels_hash=file_labels_hash)
+                )
+                session.commit()
 
             # Import notes
-            imported_count = import_notes(session, user.id, notes_list, label_map)
+            imported_count = import_notes(session, user_id, notes_list, label_map)
             total_imported += imported_count
 
             logger.info(f"Imported {imported_count} notes from {file_path}")
@@ -222,8 +359,35 @@ def import_notes_from_files(username: str, file_paths: List[str], database_url:
         return total_imported
 
     finally:
-        # Close session
-        session.close()
+        # Close session if we opened it
+        if owns_session:
+            session.close()
+
+
+def import_notes_from_files(username: str, file_paths: List[str], database_url: str = None,
+                            session: Optional[Session] = None,
+                            file_stats: Optional[List[os.stat_result]] = None) -> int:
+    """
+    Import notes from XML files into the database.
+
+    Args:
+        username: Username.
+        file_paths: List of paths to XML files.
+        database_url: Database URL (optional, will use default if not provided).
+        session: Existing database session to use instead of opening a new one (optional).
+                 The caller remains responsible for closing it.
+        file_stats: Results of os.stat for the files, in the same order, as returned
+                    by find_valid_files (optional).
+
+    Returns:
+        Total number of notes imported.
+    """
+    # Parse every file up front, then import them one after another
+    parsed_files = [
+        (file_path, labels_dict, notes_list)
+        for file_path, (labels_dict, notes_list) in zip(file_paths, parse_xml_files(file_paths, file_stats))
+    ]
+    return import_parsed_notes(username, parsed_files, database_url, session)
 
 
 def main():
@@ -236,12 +400,7 @@ def main():
     args = parser.parse_args()
 
     # Validate files
-    valid_files = []
-    for file_path in args.files:
-        if os.path.isfile(file_path):
-            valid_files.append(file_path)
-        else:
-            logger.warning(f"File not found: {file_path}")
+    valid_files, file_stats = find_valid_files(args.files)
 
     if not valid_files:
         logger.error("No valid files provided.")
@@ -249,7 +408,7 @@ def main():
 
     # Import notes
     try:
-        import_notes_from_files(args.username, valid_files, args.db)
+        import_notes_from_files(args.username, valid_files, args.db, file_stats=file_stats)
         return 0
     except Exception as e:
         logger.error(f"Error importing notes: {e}")
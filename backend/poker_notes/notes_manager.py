@@ -7,7 +7,6 @@ It serves as the main entry point for the notes management functionality.
 """
 import argparse
 import logging
-import os
 import sys
 from pathlib import Path
 from typing import List
@@ -16,7 +15,7 @@ from typing import List
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
 
 # Import the modules
-from backend.poker_notes.import_notes import import_notes_from_files
+from backend.poker_notes.import_notes import find_valid_files, import_notes_from_files
 from backend.poker_notes.export_notes import export_notes_to_file
 
 # Configure logging
@@ -33,12 +32,7 @@ logger = logging.getLogger(__name__)
 def import_notes(args):
     """Import notes from XML files."""
     # Validate files
-    valid_files = []
-    for file_path in args.files:
-        if os.path.isfile(file_path):
-            valid_files.append(file_path)
-        else:
-            logger.warning(f"File not found: {file_path}")
+    valid_files, file_stats = find_valid_files(args.files)
     
     if not valid_files:
         logger.error("No valid files provided.")
@@ -46,7 +40,7 @@ def import_notes(args):
     
     # Import notes
     try:
-        import_notes_from_files(args.username, valid_files)
+        import_notes_from_files(args.username, valid_files, file_stats=file_stats)
         return 0
     except Exception as e:
         logger.error(f"Error importing notes: {e}")
@@ -4,86 +4,669 @@ XML utilities for poker notes management.
 
 This module provides utilities for parsing and generating XML files for poker notes.
 """
+import codecs
 import logging
-import xml.etree.ElementTree as ET
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, cast
+
+# Prefer lxml, which is implemented in C; ElementTree provides the same API surface used here
+try:
+    from lxml import etree as ET  # type: ignore
+    HAS_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET  # type: ignore
+    HAS_LXML = False
+
+# ElementTree silently falls back to its pure-Python parser when the C accelerator is missing
+try:
+    import _elementtree  # type: ignore
+    HAS_C_ELEMENTTREE = ET.XMLParser is _elementtree.XMLParser
+except ImportError:
+    HAS_C_ELEMENTTREE = False
+
+# lxml refuses very long text nodes by default; a notes file can legitimately contain them
+_ITERPARSE_OPTIONS = {"huge_tree": True} if HAS_LXML else {}
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+if not HAS_LXML and not HAS_C_ELEMENTTREE:
+    logger.warning("Neither lxml nor the C ElementTree accelerator is available; XML parsing will be slow")
+
+# Translation tables for XML escaping; str.translate applies them in a single pass
+# Note content is written with all five entities escaped, as PokerStars does
+_XML_ESCAPE = str.maketrans({
+    "&": "&amp;",
+    "<": "&lt;",
+    ">": "&gt;",
+    '"': "&quot;",
+    "'": "&apos;"
+})
+_XML_TEXT_ESCAPE = str.maketrans({
+    "&": "&amp;",
+    "<": "&lt;",
+    ">": "&gt;"
+})
+_XML_ENTITIES = ("&amp;", "&lt;", "&gt;", "&quot;", "&apos;")
+
+# Most notes contain no character that needs escaping; a regex search finds that
+# much faster than str.translate, which has to build a new string
+_NEEDS_ESCAPE = re.compile('[&<>"\']').search
+
+# Note lines as PokerStars writes them; notes without content get an empty element
+_NOTE_TMPL = '\t<note player="%s" label="%s" update="%s">%s</note>\n'
+_EMPTY_NOTE_TMPL = '\t<note player="%s" label="%s" update="%s"></note>\n'
+
+# Buffer size for reading and writing notes files, so large files take few system calls
+IO_BUFFER_SIZE = 1 << 20
 
-def parse_xml_file(file_path: str) -> Tuple[Dict[int, Dict], List[Dict]]:
+# Number of parsed notes files kept in memory, so re-importing an unchanged file doesn't reparse it
+PARSE_CACHE_SIZE = 64
+
+# Parsed notes files keyed by path, modification time and size, least recently used first
+_parse_cache: "OrderedDict[Tuple[str, int, int], Tuple[Dict[int, Dict], List[Dict]]]" = OrderedDict()
+_parse_cache_lock = threading.Lock()
+
+# Number of note lines joined and written to the file at a time
+WRITE_BATCH_SIZE = 10000
+
+# Files at least this large are parsed in chunks on several threads when lxml is available
+PARALLEL_PARSE_MIN_SIZE = 1 << 20
+
+# Start of a note element; doesn't match the "notes" root element
+_NOTE_START_RE = re.compile(rb'<note[\s>/]')
+
+# Labels and notes exactly as PokerStars writes them, for parsing without an XML parser.
+# Attribute values exclude tabs and newlines, which an XML parser would turn into spaces.
+# Labels are matched once the notes are replaced with NUL characters, so they can't span one
+_FAST_LABEL_RE = re.compile(r'<label id="(\d+)" color="([^"<\t\n\x00]*)">([^<\x00]*)</label>')
+_FAST_NOTE_RE = re.compile(r'<note player="([^"<\t\n]*)" label="(\d+)" update="(\d+)"(?:/>|>([^<]*)</note>)')
+# Start of the first note, found in the raw bytes of the file
+_FAST_NOTE_START_RE = re.compile(rb'<note player="')
+# What has to be left of the file once each label and note is replaced with a NUL
+# character, which can't otherwise appear in it; labels and notes are only allowed
+# inside the root element, between other elements
+_FAST_SKELETON_RE = re.compile(
+    r'(?:<\?xml version="1\.0"(?: encoding="(?i:utf-?8)")?(?: standalone="(?:yes|no)")?[ \t\n]*\?>)?[ \t\n]*'
+    r'<notes(?: version="[^"<&]*")?[ \t\n]*>[ \t\n\x00]*'
+    r'(?:<labels[ \t\n]*>[ \t\n\x00]*</labels[ \t\n]*>[ \t\n\x00]*)?'
+    r'</notes[ \t\n]*>[ \t\n]*'
+)
+# An ampersand that doesn't start one of the five predefined entities
+_FAST_UNSUPPORTED_AMP_RE = re.compile(rb'&(?!(?:amp|lt|gt|quot|apos);)')
+# Control characters other than tab and newline, including carriage returns, which
+# an XML parser either rejects or normalizes
+_FAST_UNSUPPORTED_BYTES = bytes(c for c in range(32) if c not in (9, 10))
+
+# The exact PokerStars default labels, written to every exported file, as (id, color, name)
+DEFAULT_LABELS = (
+    ("0", "30DBFF", "Conservative"),
+    ("1", "30FF97", "Solid"),
+    ("2", "E1FF80", "Neutral"),
+    ("3", "FF9B30", "Custom Label 4"),
+    ("4", "FF304E", "Bad player"),
+    ("5", "FF30D7", "Aggressive"),
+    ("6", "303EFF", "Reckless"),
+    ("7", "1985FF", "Loose")
+)
+
+# Valid label IDs as written to the XML, so notes don't convert their label ID each time
+_LABEL_ID_STRS = tuple(str(label_id) for label_id in range(8))
+
+# The default labels section, rendered once
+_DEFAULT_LABELS_XML = (
+    '\t<labels>\n'
+    + ''.join(f'\t\t<label id="{label_id}" color="{color}">{name}</label>\n' for label_id, color, name in DEFAULT_LABELS)
+    + '\t</labels>\n'
+)
+
+
+def _escape_content(content: str) -> str:
+    """
+    Escape note content for XML output.
+
+    Content that already contains escaped entities is returned unchanged to avoid double-escaping.
+
+    Args:
+        content: Note content.
+
+    Returns:
+        Escaped content.
+    """
+    if _NEEDS_ESCAPE(content) is None:
+        return content
+    if "&" in content and any(entity in content for entity in _XML_ENTITIES):
+        return content
+    return content.translate(_XML_ESCAPE)
+
+
+def parse_xml_file(file_path: str, file_stat: Optional[os.stat_result] = None) -> Tuple[Dict[int, Dict], List[Dict]]:
     """
     Parse an XML notes file.
     
+    Results are cached while the file's modification time and size are unchanged,
+    so the returned labels and notes are shared between calls and must not be modified.
+    
+    Args:
+        file_path: Path to the XML file.
+        file_stat: Result of os.stat for the file, if the caller already has it (optional).
+        
+    Returns:
+        Tuple of (labels_dict, notes_list). Each note's "updated" value is the
+        Unix timestamp from the XML "update" attribute.
+    """
+    if file_stat is None:
+        try:
+            file_stat = os.stat(file_path)
+        except OSError as e:
+            logger.error(f"Error parsing XML file {file_path}: {e}")
+            return {}, []
+    
+    result = get_cached_xml_file(file_path, file_stat)
+    if result is None:
+        result = parse_xml_file_uncached(file_path, file_stat.st_size)
+        cache_xml_file(file_path, file_stat, result)
+    return result
+
+
+def get_cached_xml_file(file_path: str, file_stat: os.stat_result) -> Optional[Tuple[Dict[int, Dict], List[Dict]]]:
+    """
+    Get the cached result of parsing an XML notes file, if the file is unchanged since.
+    
+    Args:
+        file_path: Path to the XML file.
+        file_stat: Result of os.stat for the file.
+        
+    Returns:
+        Tuple of (labels_dict, notes_list), or None if the file isn't cached.
+    """
+    key = (file_path, file_stat.st_mtime_ns, file_stat.st_size)
+    with _parse_cache_lock:
+        result = _parse_cache.get(key)
+        if result is not None:
+            _parse_cache.move_to_end(key)
+    return result
+
+
+def cache_xml_file(file_path: str, file_stat: os.stat_result, result: Tuple[Dict[int, Dict], List[Dict]]) -> None:
+    """
+    Cache the result of parsing an XML notes file, such as one parsed in another process.
+    
+    Args:
+        file_path: Path to the XML file.
+        file_stat: Result of os.stat for the file, taken before it was parsed.
+        result: Tuple of (labels_dict, notes_list), as returned by parse_xml_file_uncached.
+    """
+    key = (file_path, file_stat.st_mtime_ns, file_stat.st_size)
+    with _parse_cache_lock:
+        _parse_cache[key] = result
+        _parse_cache.move_to_end(key)
+        while len(_parse_cache) > PARSE_CACHE_SIZE:
+            _parse_cache.popitem(last=False)
+
+
+def parse_xml_file_uncached(file_path: str, file_size: Optional[int] = None,
+                            threads: bool = True) -> Tuple[Dict[int, Dict], List[Dict]]:
+    """
+    Parse an XML notes file without using or updating the cache.
+    
+    Args:
+        file_path: Path to the XML file.
+        file_size: Size of the file in bytes, if the caller already has it (optional).
+        threads: Whether a large file may be parsed on several threads. Worker
+                 processes that already parse files in parallel should pass False.
+        
+    Returns:
+        Tuple of (labels_dict, notes_list), as returned by parse_xml_file.
+    """
+    try:
+        labels, columns = _parse_notes_columns(file_path, file_size, threads)
+    except Exception as e:
+        logger.exception(f"Error parsing XML file {file_path}: {e}")
+        return {}, []
+    
+    notes = [
+        {
+            "player": player,
+            "label_id": label_id,
+            "content": content,
+            "updated": update_timestamp,
+            "source_file": file_path
+        }
+        for player, label_id, content, update_timestamp in zip(
+            columns["player"], columns["label_id"], columns["content"], columns["updated"]
+        )
+    ]
+    return labels, notes
+
+
+def parse_xml_file_columns(file_path: str) -> Tuple[Dict[int, Dict], Dict[str, Sequence]]:
+    """
+    Parse an XML notes file into one column per note field.
+    
+    Parallel columns avoid building a dictionary per note, which matters for
+    bulk processing of large files. The result is not cached.
+    
     Args:
         file_path: Path to the XML file.
         
     Returns:
-        Tuple of (labels_dict, notes_list).
+        Tuple of (labels_dict, columns). The columns are the parallel sequences
+        "player" and "content" (lists of strings) and "label_id" and "updated"
+        (integer arrays), with one entry per note in file order.
     """
     try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        
-        # Parse labels
-        labels = {}
-        labels_elem = root.find("labels")
-        if labels_elem is not None:
-            for label_elem in labels_elem.findall("label"):
-                label_id = int(label_elem.get("id", "-1"))
-                color = label_elem.get("color", "")
-                name = label_elem.text or f"Label {label_id}"
-                labels[label_id] = {
-                    "id": label_id,
-                    "color": color,
-                    "name": name
-                }
-        
-        # Parse notes
-        notes = []
-        for note_elem in root.findall("note"):
-            player = note_elem.get("player", "")
-            label_id_str = note_elem.get("label", "-1")
-            label_id = int(label_id_str) if label_id_str.isdigit() else -1
-            update_str = note_elem.get("update", "0")
-            update_timestamp = int(update_str) if update_str.isdigit() else 0
+        return _parse_notes_columns(file_path)
+    except Exception as e:
+        logger.exception(f"Error parsing XML file {file_path}: {e}")
+        return {}, {"player": [], "label_id": array('q'), "content": [], "updated": array('q')}
+
+
+def _parse_notes_columns(file_path: str, file_size: Optional[int] = None,
+                         threads: bool = True) -> Tuple[Dict[int, Dict], Dict[str, Sequence]]:
+    """
+    Parse an XML notes file into labels and note columns.
+    
+    Args:
+        file_path: Path to the XML file.
+        file_size: Size of the file in bytes, if the caller already has it (optional).
+        threads: Whether a large file may be parsed on several threads.
+        
+    Returns:
+        Tuple of (labels_dict, columns), as returned by parse_xml_file_columns.
+    """
+    # Files in the exact layout PokerStars writes are read with regular expressions,
+    # which is faster than building elements
+    result = _parse_notes_fast(file_path)
+    
+    # Otherwise, lxml releases the GIL while parsing, so large files are parsed in chunks
+    # on several threads; files that can't be split are parsed serially below
+    workers = os.cpu_count() or 1
+    if result is None and HAS_LXML and threads and workers > 1:
+        if file_size is None:
+            file_size = os.path.getsize(file_path)
+        if file_size >= PARALLEL_PARSE_MIN_SIZE:
+            result = _parse_notes_parallel(file_path, workers)
+    
+    if result is not None:
+        labels, columns = result
+        logger.info(f"Parsed {len(columns['player'])} notes and {len(labels)} labels from {file_path}")
+        return result
+    
+    labels = {}
+    players: List[str] = []
+    label_ids = array('q')
+    contents: List[str] = []
+    updated = array('q')
+    
+    # ElementTree elements have no parent links, so without lxml the root is
+    # taken from the first start event to be able to drop finished notes from it
+    events = ("end",) if HAS_LXML else ("start", "end")
+    root = None
+    
+    # Stream the file instead of building the whole tree, handling each label
+    # and note as soon as its end tag is read
+    with open(file_path, 'rb', buffering=IO_BUFFER_SIZE) as f:
+        for event, elem in ET.iterparse(f, events=events, **_ITERPARSE_OPTIONS):
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
             
-            # Convert timestamp to datetime
-            update_datetime = datetime.fromtimestamp(update_timestamp)
+            if elem.tag == "label":
+                label = _label_data(elem)
+                labels[label["id"]] = label
+            elif elem.tag == "note":
+                _append_note(elem, players, label_ids, contents, updated)
+            else:
+                continue
             
-            content = note_elem.text or ""
+            # Free the handled element and the finished elements before it, so the tree stays small
+            elem.clear()
+            if HAS_LXML:
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+            elif elem.tag == "note" and root is not None:
+                del root[:]
+    
+    logger.info(f"Parsed {len(players)} notes and {len(labels)} labels from {file_path}")
+    return labels, {"player": players, "label_id": label_ids, "content": contents, "updated": updated}
+
+
+def _append_note(note_elem: ET.Element, players: List[str], label_ids: array, contents: List[str], updated: array) -> None:
+    """
+    Append a note element's fields to the note columns.
+    
+    Args:
+        note_elem: Note element.
+        players: Player name column.
+        label_ids: Label ID column.
+        contents: Content column.
+        updated: Update timestamp column.
+    """
+    # note_elem.get is used rather than note_elem.attrib: under lxml, .attrib builds
+    # a proxy object on each access, which makes it slower
+    player: str = note_elem.get("player", "")
+    players.append(player)
+    # Attributes are almost always valid numbers, so convert first and
+    # only fall back to the defaults on failure
+    label_id: int
+    update_timestamp: int
+    try:
+        label_id = int(note_elem.get("label", "-1"))
+        label_ids.append(label_id)
+    except (ValueError, OverflowError):
+        label_ids.append(-1)
+    try:
+        update_timestamp = int(note_elem.get("update", "0"))
+        updated.append(update_timestamp)
+    except (ValueError, OverflowError):
+        updated.append(0)
+    contents.append(note_elem.text or "")
+
+
+def _parse_notes_fast(file_path: str) -> Optional[Tuple[Dict[int, Dict], Dict[str, Sequence]]]:
+    """
+    Parse an XML notes file into labels and note columns with regular expressions.
+    
+    Only files laid out exactly as PokerStars writes them can be parsed this way:
+    attributes in PokerStars' order with double quotes, no comments, CDATA sections
+    or character references, and only the five predefined entities.
+    
+    Args:
+        file_path: Path to the XML file.
+        
+    Returns:
+        Tuple of (labels_dict, columns), as returned by parse_xml_file_columns, or None
+        if the file isn't in the expected layout, in which case it has to be parsed
+        with an XML parser.
+    """
+    with open(file_path, 'rb') as f:
+        # Empty files can't be mapped, and aren't valid XML anyway
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _scan_notes_fast(mm)
+
+
+def _scan_notes_fast(mm: mmap.mmap) -> Optional[Tuple[Dict[int, Dict], Dict[str, Sequence]]]:
+    """
+    Parse a memory-mapped XML notes file into labels and note columns with regular expressions.
+    
+    The notes are decoded and matched a block at a time, so the file is never held
+    in memory as a whole.
+    
+    Args:
+        mm: The memory-mapped file.
+        
+    Returns:
+        Tuple of (labels_dict, columns), as returned by parse_xml_file_columns, or None
+        if the file isn't in the expected layout.
+    """
+    # Reject anything the regular expressions would read differently from an XML parser
+    if mm.find(b']]>') != -1 or _FAST_UNSUPPORTED_AMP_RE.search(mm):
+        return None
+    start = len(codecs.BOM_UTF8) if mm[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+    
+    # The notes run from the first one to the end of the root element; the text
+    # around them is only the declaration, the root element and the labels
+    first_note = _FAST_NOTE_START_RE.search(mm, start)
+    if first_note is None:
+        notes_start = notes_end = len(mm)
+    else:
+        notes_start = first_note.start()
+        notes_end = mm.rfind(b'</notes')
+        if notes_end < notes_start:
+            return None
+    
+    players: List[str] = []
+    label_ids = array('q')
+    contents: List[str] = []
+    updated = array('q')
+    try:
+        # Split the notes into blocks just after a note end tag, which can't appear in a value
+        position = notes_start
+        while position < notes_end:
+            block_end = mm.find(b'</note>', min(position + IO_BUFFER_SIZE, notes_end), notes_end)
+            block_end = notes_end if block_end == -1 else block_end + len(b'</note>')
+            block = mm[position:block_end]
+            if len(block.translate(None, _FAST_UNSUPPORTED_BYTES)) != len(block):
+                return None
             
-            notes.append({
-                "player": player,
-                "label_id": label_id,
-                "content": content,
-                "updated": update_datetime,
-                "source_file": file_path
-            })
+            # Splitting on the notes gives the text between them followed by each note's
+            # four fields; anything but whitespace between them means the file is laid out differently
+            parts = _FAST_NOTE_RE.split(block.decode('utf-8'))
+            if ''.join(parts[0::5]).strip(' \t\n'):
+                return None
+            _extend_note_columns(parts, players, label_ids, contents, updated)
+            position = block_end
         
-        logger.info(f"Parsed {len(notes)} notes and {len(labels)} labels from {file_path}")
-        return labels, notes
+        outside = [mm[start:]] if first_note is None else [mm[start:notes_start], mm[notes_end:]]
+        if any(len(data.translate(None, _FAST_UNSUPPORTED_BYTES)) != len(data) for data in outside):
+            return None
+        remainder = '\x00'.join([data.decode('utf-8') for data in outside])
+    except (UnicodeDecodeError, OverflowError):
+        return None
+    
+    # Anything but whitespace around the root, labels and notes means some element
+    # is laid out differently
+    label_matches = _FAST_LABEL_RE.findall(remainder)
+    if not _FAST_SKELETON_RE.fullmatch(_FAST_LABEL_RE.sub('\x00', remainder)):
+        return None
+    
+    labels = {}
+    for label_id, color, name in label_matches:
+        label_id = int(label_id)
+        labels[label_id] = {"id": label_id, "color": _unescape(color), "name": _unescape(name) or f"Label {label_id}"}
+    
+    return labels, {"player": players, "label_id": label_ids, "content": contents, "updated": updated}
+
+
+def _extend_note_columns(parts: List[Optional[str]], players: List[str], label_ids: array,
+                         contents: List[str], updated: array) -> None:
+    """
+    Append the notes split out of a block of text by _FAST_NOTE_RE to the note columns.
+    
+    The values of a column are unescaped at once, joined by NUL characters,
+    which can't appear in them.
+    
+    Args:
+        parts: Result of splitting the text on _FAST_NOTE_RE, so each column is a slice of it.
+        players: List to append player names to.
+        label_ids: Array to append label IDs to.
+        contents: List to append note contents to.
+        updated: Array to append update timestamps to.
+        
+    Raises:
+        OverflowError: If a label ID or timestamp doesn't fit in 64 bits.
+    """
+    if len(parts) == 1:
+        return
+    # Only the content group can be missing, so the other columns are all strings
+    label_ids.extend(map(int, cast(List[str], parts[2::5])))
+    updated.extend(map(int, cast(List[str], parts[3::5])))
+    players.extend(_unescape('\x00'.join(cast(List[str], parts[1::5]))).split('\x00'))
+    contents.extend(_unescape('\x00'.join([content or "" for content in parts[4::5]])).split('\x00'))
+
+
+def _unescape(text: str) -> str:
+    """
+    Replace the five predefined XML entities in text with their characters.
+    
+    Args:
+        text: Text read from an XML file.
+        
+    Returns:
+        Unescaped text.
+    """
+    if "&" not in text:
+        return text
+    return (text.replace("&lt;", "<").replace("&gt;", ">").replace("&quot;", '"')
+            .replace("&apos;", "'").replace("&amp;", "&"))
+
+
+def _parse_notes_parallel(file_path: str, workers: int) -> Optional[Tuple[Dict[int, Dict], Dict[str, Sequence]]]:
+    """
+    Parse an XML notes file into labels and note columns on several threads.
+    
+    Only used with lxml. The notes are split into contiguous chunks at note end tags,
+    and each chunk is parsed as a document of its own.
+    
+    Args:
+        file_path: Path to the XML file.
+        workers: Number of threads to parse the chunks on.
+        
+    Returns:
+        Tuple of (labels_dict, columns), as returned by parse_xml_file_columns, or None
+        if the file can't be split, in which case it has to be parsed serially.
+    """
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        first_note = _NOTE_START_RE.search(mm)
+        notes_end = mm.rfind(b'</notes>')
+        if first_note is None or notes_end < first_note.start():
+            return None
+        notes_start = first_note.start()
+        
+        # Labels are only read from the header, so a label between the notes can't be split off
+        if mm.find(b'<label', notes_start, notes_end) != -1:
+            return None
+        
+        # Everything before the first note is the declaration, root element and labels
+        try:
+            header = ET.fromstring(mm[:notes_start] + b'</notes>', ET.XMLParser(huge_tree=True))
+        except ET.XMLSyntaxError:
+            return None
+        
+        # The chunks have no declaration of their own, so they are always read as UTF-8
+        if header.getroottree().docinfo.encoding.upper() not in ("UTF-8", "UTF8", "ASCII", "US-ASCII"):
+            return None
+        
+        # Split the notes just after the first note end tag past each chunk's share of the bytes;
+        # using more chunks than threads means only part of the tree is in memory at a time
+        chunk_count = workers * 4
+        bounds = [notes_start]
+        chunk_size = (notes_end - notes_start) // chunk_count
+        for i in range(1, chunk_count):
+            end = mm.find(b'</note>', max(bounds[-1], notes_start + i * chunk_size), notes_end)
+            if end == -1:
+                break
+            bounds.append(end + len(b'</note>'))
+        bounds.append(notes_end)
+        chunks = [mm[start:end] for start, end in zip(bounds, bounds[1:])]
+    
+    labels = {}
+    for label_elem in header.iter("label"):
+        label = _label_data(label_elem)
+        labels[label["id"]] = label
+    
+    # An end tag inside a comment or CDATA section splits a chunk in the wrong place,
+    # which makes it fail to parse
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_parse_notes_chunk, chunks))
+    except ET.XMLSyntaxError:
+        return None
+    
+    players: List[str] = []
+    label_ids = array('q')
+    contents: List[str] = []
+    updated = array('q')
+    for chunk_players, chunk_label_ids, chunk_contents, chunk_updated in results:
+        players.extend(chunk_players)
+        label_ids.extend(chunk_label_ids)
+        contents.extend(chunk_contents)
+        updated.extend(chunk_updated)
+    
+    return labels, {"player": players, "label_id": label_ids, "content": contents, "updated": updated}
+
+
+def _parse_notes_chunk(chunk: bytes) -> Tuple[List[str], array, List[str], array]:
+    """
+    Parse a chunk of consecutive note elements into note columns.
+    
+    Args:
+        chunk: UTF-8 encoded note elements.
         
+    Returns:
+        Tuple of the player, label ID, content and update timestamp columns.
+    """
+    players: List[str] = []
+    label_ids = array('q')
+    contents: List[str] = []
+    updated = array('q')
+    
+    root = ET.fromstring(b'<notes>' + chunk + b'</notes>', ET.XMLParser(huge_tree=True))
+    for note_elem in root.iterchildren("note"):
+        _append_note(note_elem, players, label_ids, contents, updated)
+    
+    return players, label_ids, contents, updated
+
+
+def parse_labels_only(file_path: str) -> Dict[int, Dict]:
+    """
+    Parse only the labels of an XML notes file.
+    
+    The labels come before the notes, so parsing stops at the end of the labels
+    section without reading the notes.
+    
+    Args:
+        file_path: Path to the XML file.
+        
+    Returns:
+        Dictionary of labels, as returned by parse_xml_file.
+    """
+    labels = {}
+    try:
+        with open(file_path, 'rb') as f:
+            for _, elem in ET.iterparse(f, events=("end",), **_ITERPARSE_OPTIONS):
+                if elem.tag == "label":
+                    label = _label_data(elem)
+                    labels[label["id"]] = label
+                elif elem.tag in ("labels", "note"):
+                    break
     except Exception as e:
-        logger.error(f"Error parsing XML file {file_path}: {e}")
-        return {}, []
+        logger.exception(f"Error parsing XML file {file_path}: {e}")
+        return {}
+    
+    return labels
 
 
-def generate_xml(username: str, labels: List[Dict], notes: List[Dict]) -> ET.Element:
+def _label_data(label_elem: ET.Element) -> Dict:
+    """
+    Get the label dictionary for a label element.
+    
+    Args:
+        label_elem: Label element.
+        
+    Returns:
+        Label dictionary with the label's id, color and name.
+    """
+    label_id = int(label_elem.get("id", "-1"))
+    return {
+        "id": label_id,
+        "color": label_elem.get("color", ""),
+        "name": label_elem.text or f"Label {label_id}"
+    }
+
+
+def generate_xml(username: str, labels: List[Dict], notes: Iterable[Dict]) -> ET.Element:
     """
     Generate XML for poker notes in the exact format PokerStars expects.
     
     Args:
         username: Username for the notes.
         labels: List of label dictionaries.
-        notes: List of note dictionaries.
+        notes: Iterable of note dictionaries (may be a generator).
         
     Returns:
         XML Element tree root.
@@ -92,77 +675,28 @@ def generate_xml(username: str, labels: List[Dict], notes: List[Dict]) -> ET.Ele
     root = ET.Element("notes")
     root.set("version", "1")
     
-    # Use the exact PokerStars default labels
-    default_labels = [
-        {"label_id": 0, "color": "30DBFF", "name": "Conservative"},
-        {"label_id": 1, "color": "30FF97", "name": "Solid"},
-        {"label_id": 2, "color": "E1FF80", "name": "Neutral"},
-        {"label_id": 3, "color": "FF9B30", "name": "Custom Label 4"},
-        {"label_id": 4, "color": "FF304E", "name": "Bad player"},
-        {"label_id": 5, "color": "FF30D7", "name": "Aggressive"},
-        {"label_id": 6, "color": "303EFF", "name": "Reckless"},
-        {"label_id": 7, "color": "1985FF", "name": "Loose"}
-    ]
-    
-    # Add labels
+    # Add labels, using the exact PokerStars default labels
     labels_elem = ET.SubElement(root, "labels")
-    for label in default_labels:
+    for label_id, color, name in DEFAULT_LABELS:
         label_elem = ET.SubElement(labels_elem, "label")
-        label_elem.set("id", str(label["label_id"]))
-        label_elem.set("color", label["color"])
-        label_elem.text = label["name"]
+        label_elem.set("id", label_id)
+        label_elem.set("color", color)
+        label_elem.text = name
     
     # Add notes
     for note in notes:
-        # Get player name and handle special cases
-        player_name = note["player_name"]
+        fields = _note_fields(note)
         
         # Skip notes with empty player names
-        if not player_name or player_name.strip() == "":
+        if fields is None:
             continue
-            
-        # Create note element
-        note_elem = ET.SubElement(root, "note")
         
-        # PokerStars handles these special characters in player names differently
-        # We need to ensure they're preserved exactly as they appear
-        # Characters like #, !, +, (, ), -, spaces, etc. should be kept as-is
-        # We don't encode these special characters in player names
+        player_name, label_id, timestamp, content = fields
+        note_elem = ET.SubElement(root, "note")
         note_elem.set("player", player_name)
-        
-        # Set label ID, defaulting to 2 (Neutral) if not specified
-        label_id = note["label_id"]
-        if label_id is not None and label_id != -1:
-            # Ensure label ID is within valid range (0-7)
-            if 0 <= label_id <= 7:
-                note_elem.set("label", str(label_id))
-            else:
-                note_elem.set("label", "2")  # Default to Neutral
-        else:
-            note_elem.set("label", "2")  # Default to Neutral
-        
-        # Convert datetime to timestamp
-        timestamp = int(note["last_updated"].timestamp())
+        note_elem.set("label", label_id)
         note_elem.set("update", str(timestamp))
-        
-        # Handle content with proper encoding
-        if note["content"]:
-            # Clean and encode the content for PokerStars compatibility
-            content = note["content"]
-            # Only escape if the content doesn't already contain escaped entities
-            if not any(x in content for x in ['&amp;', '&lt;', '&gt;', '&quot;', '&apos;']):
-                # Need to replace ampersands first to avoid double-escaping
-                content = content.replace("&", "&amp;")
-                # Replace apostrophes
-                content = content.replace("'", "&apos;")
-                # Replace less than/greater than
-                content = content.replace("<", "&lt;").replace(">", "&gt;")
-                # Replace quotes
-                content = content.replace('"', "&quot;")
-            
-            note_elem.text = content
-        else:
-            note_elem.text = ""
+        note_elem.text = content
     
     return root
 
@@ -189,57 +723,161 @@ def write_xml_to_file(root: ET.Element, file_path: str) -> bool:
         # Add labels section
         xml_lines.append('\t<labels>\n')
         for label_elem in root.find('labels').findall('label'):
-            label_id = label_elem.get('id')
-            color = label_elem.get('color')
-            name = label_elem.text or f"Label {label_id}"
+            label_id = label_elem.get('id', '')
+            color = label_elem.get('color', '')
+            name = (label_elem.text or f"Label {label_id}").translate(_XML_TEXT_ESCAPE)
             xml_lines.append(f'\t\t<label id="{label_id}" color="{color}">{name}</label>\n')
         xml_lines.append('\t</labels>\n')
         
-        # Add notes section
-        for note_elem in root.findall('note'):
-            player = note_elem.get('player')
-            label = note_elem.get('label', '2')
-            update = note_elem.get('update', '0')
-            content = note_elem.text or ""
-            
-            # Ensure player name is preserved exactly as-is
-            # PokerStars expects these special characters to be unencoded in the XML
-            # Start note tag
-            note_line = f'\t<note player="{player}" label="{label}" update="{update}"'
+        # Format each note with a single template operation.
+        # Player names are preserved exactly as-is, since PokerStars expects these
+        # special characters to be unencoded in the XML.
+        # iterfind yields the notes as it goes, rather than first building a list of them
+        note_tuples = (
+            (note_elem.get('player', ''), note_elem.get('label', '2'), note_elem.get('update', '0'), note_elem.text or "")
+            for note_elem in root.iterfind('note')
+        )
+        note_lines = (
+            _NOTE_TMPL % (player, label, update, _escape_content(content)) if content.strip()
+            else _EMPTY_NOTE_TMPL % (player, label, update)
+            for player, label, update, content in note_tuples
+        )
+        
+        # Write the notes in batches, so only one batch of lines is held in memory.
+        # Each batch is joined and encoded once, then written as bytes so the file
+        # object doesn't run its own text codec layer
+        with open(file_path, 'wb', buffering=IO_BUFFER_SIZE) as f:
+            f.write(''.join(xml_lines).encode('utf-8'))
+            while True:
+                batch = list(islice(note_lines, WRITE_BATCH_SIZE))
+                if not batch:
+                    break
+                f.write(''.join(batch).encode('utf-8'))
             
-            # If content is empty, use self-closing tag format that PokerStars expects
-            if not content.strip():
-                note_line += "></note>\n"
-            else:
-                # Only escape if the content doesn't already contain escaped entities
-                if not any(x in content for x in ['&amp;', '&lt;', '&gt;', '&quot;', '&apos;']):
-                    # Need to replace ampersands first to avoid double-escaping
-                    escaped_content = content.replace("&", "&amp;")
-                    # Replace apostrophes
-                    escaped_content = escaped_content.replace("'", "&apos;")
-                    # Replace less than/greater than
-                    escaped_content = escaped_content.replace("<", "&lt;").replace(">", "&gt;")
-                    # Replace quotes
-                    escaped_content = escaped_content.replace('"', "&quot;")
-                    note_line += f">{escaped_content}</note>\n"
-                else:
-                    # Content already has escaped entities, use as is
-                    note_line += f">{content}</note>\n"
-                
-            xml_lines.append(note_line)
-        
-        # Close notes tag
-        xml_lines.append('</notes>\n')
-        
-        # Join all lines to create the final XML
-        xml_content = ''.join(xml_lines)
-        
-        # Write to file
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(xml_content)
+            # Close notes tag
+            f.write(b'</notes>\n')
         
         logger.info(f"Successfully wrote XML to {file_path}")
         return True
     except Exception as e:
         logger.error(f"Error writing XML to {file_path}: {e}")
         return False
+
+
+def _note_fields(note: Dict) -> Optional[Tuple[str, str, int, str]]:
+    """
+    Normalize a note dictionary into the values written to the XML.
+
+    Shared by generate_xml and export_notes_stream so both apply the same rules.
+
+    Args:
+        note: Note dictionary.
+
+    Returns:
+        Tuple of (player_name, label_id, timestamp, escaped_content), with the label
+        ID as a string, or None if the note has no player name and should be skipped.
+    """
+    player_name = note["player_name"]
+    if not player_name or not player_name.strip():
+        return None
+    
+    # PokerStars handles special characters in player names differently, so they
+    # are preserved exactly as they appear. Characters like #, !, +, (, ), -,
+    # spaces, etc. are kept as-is and not encoded
+    
+    # Label IDs default to 2 (Neutral) if not specified or outside the valid range (0-7)
+    label_id = note["label_id"]
+    if label_id is None or not 0 <= label_id <= 7:
+        label_id = 2
+    label_id = _LABEL_ID_STRS[label_id]
+    
+    # Timestamps are stored as Unix timestamps; datetimes are still accepted
+    timestamp = note["last_updated"]
+    if isinstance(timestamp, datetime):
+        timestamp = int(timestamp.timestamp())
+    
+    # Escape the content for PokerStars compatibility, unless it already
+    # contains escaped entities
+    content = _escape_content(note["content"]) if note["content"] else ""
+    
+    return player_name, label_id, timestamp, content
+
+
+def _format_note(note: Dict) -> str:
+    """
+    Format a note dictionary as a PokerStars note line.
+
+    Applies the same rules as generate_xml followed by write_xml_to_file.
+
+    Args:
+        note: Note dictionary.
+
+    Returns:
+        The note line, or an empty string if the note has no player name.
+    """
+    fields = _note_fields(note)
+    if fields is None:
+        return ""
+    
+    player_name, label_id, timestamp, content = fields
+    if not content.strip():
+        return _EMPTY_NOTE_TMPL % (player_name, label_id, timestamp)
+    return _NOTE_TMPL % fields
+
+
+def export_notes_stream(username: str, labels: List[Dict], notes: Iterable[Dict], file_path: str) -> int:
+    """
+    Write notes straight to an XML file in the exact format PokerStars expects.
+
+    Produces the same output as generate_xml followed by write_xml_to_file, but
+    each note is formatted and written as it is read, so no element tree is built
+    and the notes may be streamed from the database.
+
+    The notes are written to a temporary file next to file_path, which replaces
+    file_path only once every note has been written. If anything fails part way,
+    an existing file (possibly the live PokerStars notes file) is left untouched.
+
+    Args:
+        username: Username for the notes.
+        labels: List of label dictionaries.
+        notes: Iterable of note dictionaries (may be a generator).
+        file_path: Path to write the XML file.
+
+    Returns:
+        Number of notes written.
+
+    Raises:
+        OSError: If the file can't be written.
+    """
+    note_count = 0
+    
+    # The temporary file has to be in the same directory for os.replace to be atomic
+    directory, file_name = os.path.split(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{file_name}.", suffix=".tmp")
+    try:
+        # newline='\n' keeps the line endings PokerStars writes on every platform
+        with open(fd, 'w', buffering=IO_BUFFER_SIZE, encoding='utf-8', newline='\n') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<notes version="1">\n')
+            f.write(_DEFAULT_LABELS_XML)
+            
+            for note in notes:
+                note_line = _format_note(note)
+                if note_line:
+                    f.write(note_line)
+                    note_count += 1
+            
+            f.write('</notes>\n')
+        
+        # mkstemp creates the file readable by the owner only; keep the permissions
+        # of the file being replaced
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        else:
+            os.chmod(temp_path, 0o644)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    
+    logger.info(f"Successfully wrote {note_count} notes to {file_path}")
+    return note_count
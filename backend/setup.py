@@ -1,3 +1,16 @@
+import os
+
 from setuptools import setup
 
-setup()
+ext_modules = []
+
+# Optionally compile the notes XML utilities ahead of time with mypyc
+# (pip install mypy, then run POKER_HUD_MYPYC=1 python setup.py build_ext --inplace)
+if os.environ.get("POKER_HUD_MYPYC"):
+    from mypyc.build import mypycify
+
+    ext_modules = mypycify(["poker_notes/xml_utils.py"])
+
+# mypyc names the module after its full import path, backend.poker_notes.xml_utils,
+# so map the backend package onto this directory for the extension to be placed next to the source
+setup(ext_modules=ext_modules, package_dir={"backend": "."})
@@ -3,24 +3,78 @@ Database module for storing poker hand data.
 """
 import logging
 import os
+from enum import IntEnum
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterable, List, Any, Optional, Tuple
 from datetime import datetime
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import (
+    create_engine, case, event, Column, Index, Integer, SmallInteger, String, Float, DateTime, ForeignKey, Boolean, Text
+)
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, Session
+from sqlalchemy.pool import QueuePool
 
 from backend.config import DATABASE_URL
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Create SQLAlchemy engine and session
-engine = create_engine(DATABASE_URL)
+# Create SQLAlchemy engine and session. For SQLite files, keep a pool of open
+# connections (SQLAlchemy otherwise opens a new one per session) that can be
+# shared between the collector, API worker threads and the monitoring thread
+if DATABASE_URL.startswith("sqlite"):
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        poolclass=QueuePool,
+        pool_size=8,
+        max_overflow=16,
+    )
+else:
+    engine = create_engine(DATABASE_URL, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# SQLite settings applied to every new connection. WAL journaling with
+# synchronous=NORMAL avoids an fsync per commit (a crash can lose the last
+# commits, but never corrupts the database, which is fine for HUD data)
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=1073741824",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+)
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Configure journaling, syncing and caching for new SQLite connections.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
 Base = declarative_base()
 
+# Number of hands stored between session flushes when streaming a file
+HAND_BATCH_SIZE = 500
+
+# INSERT constructs that support ON CONFLICT DO UPDATE, by dialect name
+_UPSERT_INSERTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+
+# HandFile columns replaced when a file's processing record is written again
+_HAND_FILE_UPDATE_COLUMNS = ("processed_at", "file_size", "hand_count", "status", "error_message", "last_offset")
+
 
 class Hand(Base):
     """
@@ -43,6 +97,11 @@ class Hand(Base):
     max_players = Column(Integer, nullable=True)  # Maximum number of players at the table
     table_name = Column(String, nullable=True)  # Name of the table
 
+    # Serves the most-recent-first hand listings in the stats API
+    __table_args__ = (
+        Index('ix_hand_date_time_desc', date_time.desc()),
+    )
+
     participants = relationship("HandParticipant", back_populates="hand", cascade="all, delete-orphan")
     actions = relationship("Action", back_populates="hand", cascade="all, delete-orphan")
     pots = relationship("Pot", back_populates="hand", cascade="all, delete-orphan")
@@ -92,6 +151,47 @@ class HandParticipant(Base):
     actions = relationship("Action", back_populates="participant", foreign_keys="Action.participant_id")
 
 
+class ActionType(IntEnum):
+    """
+    Integer codes for action types, stored alongside the action type names.
+    """
+    FOLD = 0
+    CHECK = 1
+    CALL = 2
+    BET = 3
+    RAISE = 4
+    ALL_IN = 5
+    ANTE = 6
+    SMALL_BLIND = 7
+    BIG_BLIND = 8
+
+
+class Street(IntEnum):
+    """
+    Integer codes for streets, stored alongside the street names.
+    """
+    PREFLOP = 0
+    FLOP = 1
+    TURN = 2
+    RIVER = 3
+    SHOWDOWN = 4
+
+
+# Action type and street names as produced by the parser, mapped to their codes
+ACTION_TYPE_CODES = {
+    'fold': ActionType.FOLD,
+    'check': ActionType.CHECK,
+    'call': ActionType.CALL,
+    'bet': ActionType.BET,
+    'raise': ActionType.RAISE,
+    'all-in': ActionType.ALL_IN,
+    'ante': ActionType.ANTE,
+    'small_blind': ActionType.SMALL_BLIND,
+    'big_blind': ActionType.BIG_BLIND,
+}
+STREET_CODES = {street.name.lower(): street for street in Street}
+
+
 class Action(Base):
     """
     SQLAlchemy model for a player action in a hand.
@@ -104,10 +204,17 @@ class Action(Base):
     participant_id = Column(Integer, ForeignKey("hand_participants.id"), nullable=True, index=True)
     action_type = Column(String)  # fold, check, call, bet, raise, all-in, ante, small_blind, big_blind
     street = Column(String)  # preflop, flop, turn, river, showdown
+    action_type_code = Column(SmallInteger)  # ActionType of action_type, used for filtering
+    street_code = Column(SmallInteger)  # Street of street, used for filtering
     amount = Column(Float, nullable=True)
     is_all_in = Column(Boolean, default=False)
     sequence = Column(Integer)  # Order of actions in the hand
 
+    # Covers the per-player action counters in the stats API
+    __table_args__ = (
+        Index('ix_action_player_street_type_code', 'player_id', 'street_code', 'action_type_code'),
+    )
+
     hand = relationship("Hand", back_populates="actions")
     player = relationship("Player", back_populates="actions")
     participant = relationship("HandParticipant", back_populates="actions", foreign_keys=[participant_id])
@@ -163,6 +270,7 @@ class HandFile(Base):
     hand_count = Column(Integer)
     status = Column(String)  # processed, error, etc.
     error_message = Column(Text, nullable=True)
+    last_offset = Column(Integer, nullable=True)  # Byte offset up to which hands have been stored
 
 
 class Database:
@@ -182,8 +290,48 @@ class Database:
         Create database tables if they don't exist.
         """
         Base.metadata.create_all(bind=self.engine)
+        self._migrate_columns()
         logger.info("Database tables created")
 
+    def _migrate_columns(self):
+        """
+        Add columns and indexes introduced after the hand_files and actions tables were first created.
+        """
+        from sqlalchemy import inspect
+        inspector = inspect(self.engine)
+        
+        existing_columns = [col['name'] for col in inspector.get_columns('hand_files')]
+        if 'last_offset' not in existing_columns:
+            with self.engine.begin() as conn:
+                conn.exec_driver_sql('ALTER TABLE hand_files ADD COLUMN last_offset INTEGER')
+            logger.info("Added last_offset column to hand_files table")
+        
+        existing_columns = [col['name'] for col in inspector.get_columns('actions')]
+        if 'action_type_code' not in existing_columns:
+            with self.engine.begin() as conn:
+                conn.exec_driver_sql('ALTER TABLE actions ADD COLUMN action_type_code SMALLINT')
+                conn.exec_driver_sql('ALTER TABLE actions ADD COLUMN street_code SMALLINT')
+                # Fill in the codes of the actions stored before the columns existed
+                conn.execute(Action.__table__.update().values(
+                    action_type_code=case(
+                        {name: int(code) for name, code in ACTION_TYPE_CODES.items()},
+                        value=Action.__table__.c.action_type
+                    ),
+                    street_code=case(
+                        {name: int(code) for name, code in STREET_CODES.items()},
+                        value=Action.__table__.c.street
+                    )
+                ))
+            logger.info("Added action_type_code and street_code columns to actions table")
+        
+        # Create indexes added to existing tables
+        for table in (Hand.__table__, Action.__table__):
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=self.engine)
+                    logger.info(f"Created index {index.name}")
+
     def get_session(self) -> Session:
         """
         Get a database session.
@@ -257,6 +405,8 @@ class Database:
             # Create just the pot_winners table
             PotWinner.__table__.create(bind=self.engine, checkfirst=True)
             logger.info("Created pot_winners table")
+
+        self._migrate_columns()
                 
         logger.info("Database migration completed successfully.")
 
@@ -277,7 +427,8 @@ class Database:
         finally:
             self.close_session(session)
 
-    def mark_file_processed(self, file_path: str, hand_count: int, status: str = "processed", error_message: Optional[str] = None):
+    def mark_file_processed(self, file_path: str, hand_count: int, status: str = "processed", error_message: Optional[str] = None,
+                            last_offset: Optional[int] = None):
         """
         Mark a hand history file as processed.
 
@@ -286,19 +437,13 @@ class Database:
             hand_count: Number of hands processed from the file.
             status: Processing status.
             error_message: Error message if processing failed.
+            last_offset: Byte offset up to which the file was parsed (defaults to the current file size).
         """
         session = self.get_session()
         try:
-            file_size = Path(file_path).stat().st_size
-            hand_file = HandFile(
-                file_path=str(file_path),
-                processed_at=datetime.utcnow(),
-                file_size=file_size,
-                hand_count=hand_count,
-                status=status,
-                error_message=error_message
+            self._upsert_hand_files(
+                session, [self._hand_file_record(file_path, hand_count, status, error_message, last_offset)]
             )
-            session.add(hand_file)
             session.commit()
             logger.info(f"Marked file as processed: {file_path}")
         except Exception as e:
@@ -307,247 +452,462 @@ class Database:
         finally:
             self.close_session(session)
 
-    def store_hand(self, hand_data: Dict[str, Any]):
+    def _hand_file_record(self, file_path: str, hand_count: int, status: str = "processed",
+                          error_message: Optional[str] = None, last_offset: Optional[int] = None) -> Dict[str, Any]:
         """
-        Store a parsed hand in the database.
+        Build the values of the processing record for a hand history file.
 
         Args:
-            hand_data: Dictionary containing parsed hand data.
+            file_path: Path to the hand history file.
+            hand_count: Number of hands processed from the file.
+            status: Processing status.
+            error_message: Error message if processing failed.
+            last_offset: Byte offset up to which the file was parsed (defaults to the current file size).
+
+        Returns:
+            Dictionary of HandFile column values.
+        """
+        file_size = Path(file_path).stat().st_size
+        return {
+            "file_path": str(file_path),
+            "processed_at": datetime.utcnow(),
+            "file_size": file_size,
+            "hand_count": hand_count,
+            "status": status,
+            "error_message": error_message,
+            "last_offset": file_size if last_offset is None else last_offset,
+        }
+
+    def _upsert_hand_files(self, session: Session, records: List[Dict[str, Any]]):
+        """
+        Insert or update hand history file processing records within an open session.
+
+        On SQLite and PostgreSQL, uses a single INSERT ... ON CONFLICT(file_path) DO UPDATE
+        statement, executed once for all records, instead of looking each file up first.
+        Other databases fall back to looking up and updating each record.
+
+        Args:
+            session: SQLAlchemy session.
+            records: HandFile column values, as built by _hand_file_record.
+        """
+        if not records:
+            return
+        
+        insert = _UPSERT_INSERTS.get(self.engine.dialect.name)
+        if insert is None:
+            for record in records:
+                hand_file = session.query(HandFile).filter(HandFile.file_path == record["file_path"]).first()
+                if not hand_file:
+                    hand_file = HandFile(file_path=record["file_path"])
+                    session.add(hand_file)
+                for column in _HAND_FILE_UPDATE_COLUMNS:
+                    setattr(hand_file, column, record[column])
+            return
+        
+        stmt = insert(HandFile)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[HandFile.file_path],
+            set_={column: stmt.excluded[column] for column in _HAND_FILE_UPDATE_COLUMNS}
+        )
+        session.execute(stmt, records)
+
+    def get_file_offset(self, file_path: str) -> Optional[int]:
+        """
+        Get the byte offset up to which a hand history file has been stored.
+
+        Args:
+            file_path: Path to the hand history file.
+
+        Returns:
+            The stored offset, or None if the file has no record (or no offset yet).
         """
         session = self.get_session()
         try:
-            # Track tournaments we've seen to avoid duplicate logging
-            # Check if hand already exists
-            existing_hand = session.query(Hand).filter(Hand.hand_id == hand_data['hand_id']).first()
-            if existing_hand:
-                logger.debug(f"Hand {hand_data['hand_id']} already exists in the database")
-                return
-            
-            # Create the hand record
-            hand = Hand(
-                hand_id=hand_data['hand_id'],
-                tournament_id=hand_data.get('tournament_id'),
-                game_type=hand_data.get('game_type'),
-                date_time=hand_data.get('date_time'),
-                small_blind=hand_data.get('small_blind', 0),
-                big_blind=hand_data.get('big_blind', 0),
-                ante=hand_data.get('ante', 0),
-                pot=hand_data.get('pot', 0),
-                rake=hand_data.get('rake', 0),
-                board=' '.join(hand_data.get('board', [])),
-                button_seat=hand_data.get('button_seat'),
-                max_players=hand_data.get('max_players'),
-                table_name=hand_data.get('table_name')
-            )
-            session.add(hand)
-            
-            # Track tournaments we've seen to avoid duplicate logging
-            if not hasattr(self, '_processed_tournaments'):
-                self._processed_tournaments = set()
-                
-            # Only log when processing a new tournament
-            tournament_id = hand_data.get('tournament_id')
-            if tournament_id and tournament_id not in self._processed_tournaments:
-                self._processed_tournaments.add(tournament_id)
-                logger.info(f"Processing tournament: {tournament_id} - {hand_data.get('game_type', '')}")
+            return session.query(HandFile.last_offset).filter(HandFile.file_path == str(file_path)).scalar()
+        finally:
+            self.close_session(session)
+
+    def record_appended_hands(self, file_path: str, hand_count: int, last_offset: int):
+        """
+        Update a processed file's record after storing hands appended to it.
+
+        Args:
+            file_path: Path to the hand history file.
+            hand_count: Number of hands stored from the appended data.
+            last_offset: Byte offset up to which the file has now been parsed.
+        """
+        session = self.get_session()
+        try:
+            session.query(HandFile).filter(HandFile.file_path == str(file_path)).update({
+                HandFile.hand_count: HandFile.hand_count + hand_count,
+                HandFile.last_offset: last_offset,
+                HandFile.file_size: Path(file_path).stat().st_size,
+                HandFile.processed_at: datetime.utcnow(),
+            }, synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error updating file record: {e}")
+        finally:
+            self.close_session(session)
+
+    def _add_hand(self, session: Session, hand_data: Dict[str, Any]) -> bool:
+        """
+        Add a parsed hand and its related records to an open session.
+
+        The caller is responsible for committing or rolling back the session.
+
+        Args:
+            session: SQLAlchemy session.
+            hand_data: Dictionary containing parsed hand data.
+
+        Returns:
+            True if the hand was added, False if it already exists in the database.
+        """
+        # Check if hand already exists
+        existing_hand = session.query(Hand).filter(Hand.hand_id == hand_data['hand_id']).first()
+        if existing_hand:
+            logger.debug(f"Hand {hand_data['hand_id']} already exists in the database")
+            return False
+        
+        
+        # Create the hand record
+        hand = Hand(
+            hand_id=hand_data['hand_id'],
+            tournament_id=hand_data.get('tournament_id'),
+            game_type=hand_data.get('game_type'),
+            date_time=hand_data.get('date_time'),
+            small_blind=hand_data.get('small_blind', 0),
+            big_blind=hand_data.get('big_blind', 0),
+            ante=hand_data.get('ante', 0),
+            pot=hand_data.get('pot', 0),
+            rake=hand_data.get('rake', 0),
+            board=' '.join(hand_data.get('board', [])),
+            button_seat=hand_data.get('button_seat'),
+            max_players=hand_data.get('max_players'),
+            table_name=hand_data.get('table_name')
+        )
+        session.add(hand)
+        
+        # Track tournaments we've seen to avoid duplicate logging
+        if not hasattr(self, '_processed_tournaments'):
+            self._processed_tournaments = set()
             
-            session.flush()  # Flush to get the hand ID
+        # Only log when processing a new tournament
+        tournament_id = hand_data.get('tournament_id')
+        if tournament_id and tournament_id not in self._processed_tournaments:
+            self._processed_tournaments.add(tournament_id)
+            logger.info(f"Processing tournament: {tournament_id} - {hand_data.get('game_type', '')}")
+        
+        session.flush()  # Flush to get the hand ID
 
-            # Dictionary to map participant IDs to their objects
-            participant_objects = {}
+        # Dictionary to map participant IDs to their objects
+        participant_objects = {}
+        
+        # Process participants (players in this specific hand)
+        for participant_data in hand_data.get('participants', []):
+            player_name = participant_data.get('player_name')
             
-            # Process participants (players in this specific hand)
-            for participant_data in hand_data.get('participants', []):
-                player_name = participant_data.get('player_name')
-                
-                # Find or create the global player record
-                player = session.query(Player).filter(Player.name == player_name).first()
-                if not player:
-                    # Create a new player record if this is the first time we've seen them
-                    player = Player(
-                        name=player_name,
-                        first_seen=hand_data['date_time'],
-                        last_seen=hand_data['date_time']
-                    )
-                    session.add(player)
-                else:
-                    # Update the last_seen timestamp for existing players
-                    player.last_seen = hand_data['date_time']
-                
-                session.flush()  # Ensure player has an ID
-                
-                # Create the hand participant record (player in this specific hand)
-                participant = HandParticipant(
-                    hand_id=hand.id,
-                    player_id=player.id,
-                    seat=participant_data['seat'],
-                    stack=participant_data['stack'],
-                    cards=' '.join(participant_data['cards']) if participant_data.get('cards') else None,
-                    bounty=participant_data.get('bounty'),
-                    is_small_blind=participant_data.get('is_small_blind', False),
-                    is_big_blind=participant_data.get('is_big_blind', False),
-                    is_button=participant_data.get('is_button', False),
-                    showed_cards=participant_data.get('showed_cards', False),
-                    final_stack=participant_data.get('final_stack'),
-                    net_won=participant_data.get('net_won')
+            # Find or create the global player record
+            player = session.query(Player).filter(Player.name == player_name).first()
+            if not player:
+                # Create a new player record if this is the first time we've seen them
+                player = Player(
+                    name=player_name,
+                    first_seen=hand_data['date_time'],
+                    last_seen=hand_data['date_time']
                 )
-                session.add(participant)
-                session.flush()  # Ensure participant has an ID
-                
-                # Store the participant object for later reference
-                participant_objects[participant_data['id']] = participant
+                session.add(player)
+            else:
+                # Update the last_seen timestamp for existing players
+                player.last_seen = hand_data['date_time']
             
-            # Handle backwards compatibility with old format
-            if not hand_data.get('participants') and hand_data.get('players'):
-                # Old format with players as a dictionary
-                if isinstance(hand_data['players'], dict):
-                    for player_name, player_data in hand_data['players'].items():
-                        # Find or create the global player record
-                        player = session.query(Player).filter(Player.name == player_name).first()
-                        if not player:
-                            player = Player(
-                                name=player_name,
-                                first_seen=hand_data['date_time'],
-                                last_seen=hand_data['date_time']
-                            )
-                            session.add(player)
-                        else:
-                            player.last_seen = hand_data['date_time']
-                        
-                        session.flush()
-                        
-                        # Create the hand participant record
-                        participant = HandParticipant(
-                            hand_id=hand.id,
-                            player_id=player.id,
-                            seat=player_data['seat'],
-                            stack=player_data['stack'],
-                            cards=' '.join(player_data['cards']) if player_data.get('cards') else None,
-                            bounty=player_data.get('bounty'),
-                            is_small_blind=player_data.get('is_small_blind', False),
-                            is_big_blind=player_data.get('is_big_blind', False),
-                            is_button=player_data.get('is_button', False),
-                            showed_cards=player_data.get('showed_cards', False)
+            session.flush()  # Ensure player has an ID
+            
+            # Create the hand participant record (player in this specific hand)
+            participant = HandParticipant(
+                hand_id=hand.id,
+                player_id=player.id,
+                seat=participant_data['seat'],
+                stack=participant_data['stack'],
+                cards=' '.join(participant_data['cards']) if participant_data.get('cards') else None,
+                bounty=participant_data.get('bounty'),
+                is_small_blind=participant_data.get('is_small_blind', False),
+                is_big_blind=participant_data.get('is_big_blind', False),
+                is_button=participant_data.get('is_button', False),
+                showed_cards=participant_data.get('showed_cards', False),
+                final_stack=participant_data.get('final_stack'),
+                net_won=participant_data.get('net_won')
+            )
+            session.add(participant)
+            session.flush()  # Ensure participant has an ID
+            
+            # Store the participant object for later reference
+            participant_objects[participant_data['id']] = participant
+        
+        # Handle backwards compatibility with old format
+        if not hand_data.get('participants') and hand_data.get('players'):
+            # Old format with players as a dictionary
+            if isinstance(hand_data['players'], dict):
+                for player_name, player_data in hand_data['players'].items():
+                    # Find or create the global player record
+                    player = session.query(Player).filter(Player.name == player_name).first()
+                    if not player:
+                        player = Player(
+                            name=player_name,
+                            first_seen=hand_data['date_time'],
+                            last_seen=hand_data['date_time']
                         )
-                        session.add(participant)
-                        session.flush()
-                        
-                        # Store for action mapping
-                        participant_objects[player_name] = participant
-                # New format with players as a list
-                elif isinstance(hand_data['players'], list):
-                    for player_data in hand_data['players']:
-                        player_name = player_data.get('name')
-                        
-                        # Find or create the global player record
-                        player = session.query(Player).filter(Player.name == player_name).first()
-                        if not player:
-                            player = Player(
-                                name=player_name,
-                                first_seen=hand_data['date_time'],
-                                last_seen=hand_data['date_time']
-                            )
-                            session.add(player)
-                        else:
-                            player.last_seen = hand_data['date_time']
-                        
-                        session.flush()
-                        
-                        # Create the hand participant record
-                        participant = HandParticipant(
-                            hand_id=hand.id,
-                            player_id=player.id,
-                            seat=player_data['seat'],
-                            stack=player_data['stack'],
-                            cards=' '.join(player_data['cards']) if player_data.get('cards') else None,
-                            bounty=player_data.get('bounty'),
-                            is_small_blind=player_data.get('is_small_blind', False),
-                            is_big_blind=player_data.get('is_big_blind', False),
-                            is_button=player_data.get('is_button', False),
-                            showed_cards=player_data.get('showed_cards', False)
+                        session.add(player)
+                    else:
+                        player.last_seen = hand_data['date_time']
+                    
+                    session.flush()
+                    
+                    # Create the hand participant record
+                    participant = HandParticipant(
+                        hand_id=hand.id,
+                        player_id=player.id,
+                        seat=player_data['seat'],
+                        stack=player_data['stack'],
+                        cards=' '.join(player_data['cards']) if player_data.get('cards') else None,
+                        bounty=player_data.get('bounty'),
+                        is_small_blind=player_data.get('is_small_blind', False),
+                        is_big_blind=player_data.get('is_big_blind', False),
+                        is_button=player_data.get('is_button', False),
+                        showed_cards=player_data.get('showed_cards', False)
+                    )
+                    session.add(participant)
+                    session.flush()
+                    
+                    # Store for action mapping
+                    participant_objects[player_name] = participant
+            # New format with players as a list
+            elif isinstance(hand_data['players'], list):
+                for player_data in hand_data['players']:
+                    player_name = player_data.get('name')
+                    
+                    # Find or create the global player record
+                    player = session.query(Player).filter(Player.name == player_name).first()
+                    if not player:
+                        player = Player(
+                            name=player_name,
+                            first_seen=hand_data['date_time'],
+                            last_seen=hand_data['date_time']
                         )
-                        session.add(participant)
-                        session.flush()
-                        
-                        # Store for action mapping
-                        participant_objects[player_data.get('id', player_name)] = participant
-
-            # Add actions
-            for i, action_data in enumerate(hand_data.get('actions', [])):
-                # Find the participant for this action
-                participant = None
-                
-                # Try to find by participant_id first (new format)
-                if action_data.get('participant_id') and action_data['participant_id'] in participant_objects:
-                    participant = participant_objects[action_data['participant_id']]
-                
-                # Fall back to player_name (both formats)
-                elif action_data.get('player_name'):
-                    # Try to find by player_name in participant_objects
-                    for p in participant_objects.values():
-                        if hasattr(p, 'player') and p.player and p.player.name == action_data['player_name']:
-                            participant = p
-                            break
-                
-                # Fall back to 'player' field (old format)
-                elif action_data.get('player') and action_data['player'] in participant_objects:
-                    participant = participant_objects[action_data['player']]
-                
-                if participant:
-                    # Create the action record
-                    action = Action(
+                        session.add(player)
+                    else:
+                        player.last_seen = hand_data['date_time']
+                    
+                    session.flush()
+                    
+                    # Create the hand participant record
+                    participant = HandParticipant(
                         hand_id=hand.id,
-                        player_id=participant.player_id,
-                        participant_id=participant.id,
-                        action_type=action_data.get('action_type', action_data.get('action')),  # Support both formats
-                        street=action_data['street'],
-                        amount=action_data.get('amount'),
-                        is_all_in=action_data.get('is_all_in', False),
-                        sequence=action_data.get('sequence', i)  # Use provided sequence or index
+                        player_id=player.id,
+                        seat=player_data['seat'],
+                        stack=player_data['stack'],
+                        cards=' '.join(player_data['cards']) if player_data.get('cards') else None,
+                        bounty=player_data.get('bounty'),
+                        is_small_blind=player_data.get('is_small_blind', False),
+                        is_big_blind=player_data.get('is_big_blind', False),
+                        is_button=player_data.get('is_button', False),
+                        showed_cards=player_data.get('showed_cards', False)
                     )
-                    session.add(action)
-
-            # Winners are now handled through pot_winners
+                    session.add(participant)
+                    session.flush()
+                    
+                    # Store for action mapping
+                    participant_objects[player_data.get('id', player_name)] = participant
+
+        # Add actions
+        for i, action_data in enumerate(hand_data.get('actions', [])):
+            # Find the participant for this action
+            participant = None
+            
+            # Try to find by participant_id first (new format)
+            if action_data.get('participant_id') and action_data['participant_id'] in participant_objects:
+                participant = participant_objects[action_data['participant_id']]
             
-            # Add pots and pot winners
-            for pot_data in hand_data.get('pots', []):
-                # Create the pot record
-                pot = Pot(
+            # Fall back to player_name (both formats)
+            elif action_data.get('player_name'):
+                # Try to find by player_name in participant_objects
+                for p in participant_objects.values():
+                    if hasattr(p, 'player') and p.player and p.player.name == action_data['player_name']:
+                        participant = p
+                        break
+            
+            # Fall back to 'player' field (old format)
+            elif action_data.get('player') and action_data['player'] in participant_objects:
+                participant = participant_objects[action_data['player']]
+            
+            if participant:
+                # Create the action record
+                action_type = action_data.get('action_type', action_data.get('action'))  # Support both formats
+                action = Action(
                     hand_id=hand.id,
-                    pot_type=pot_data['pot_type'],
-                    amount=pot_data['amount']
+                    player_id=participant.player_id,
+                    participant_id=participant.id,
+                    action_type=action_type,
+                    street=action_data['street'],
+                    action_type_code=ACTION_TYPE_CODES.get(action_type),
+                    street_code=STREET_CODES.get(action_data['street']),
+                    amount=action_data.get('amount'),
+                    is_all_in=action_data.get('is_all_in', False),
+                    sequence=action_data.get('sequence', i)  # Use provided sequence or index
                 )
-                session.add(pot)
-                session.flush()  # Flush to get the pot ID
-                
-                # Add winners for this pot
-                for winner_data in pot_data.get('winners', []):
-                    # Find the participant for this winner
-                    participant_id = winner_data.get('participant_id')
-                    if participant_id and participant_id in participant_objects:
-                        pot_winner = PotWinner(
-                            pot_id=pot.id,
-                            participant_id=participant_objects[participant_id].id,
-                            amount=winner_data['amount']
-                        )
-                        session.add(pot_winner)
+                session.add(action)
+
+        # Winners are now handled through pot_winners
+        
+        # Add pots and pot winners
+        for pot_data in hand_data.get('pots', []):
+            # Create the pot record
+            pot = Pot(
+                hand_id=hand.id,
+                pot_type=pot_data['pot_type'],
+                amount=pot_data['amount']
+            )
+            session.add(pot)
+            session.flush()  # Flush to get the pot ID
+            
+            # Add winners for this pot
+            for winner_data in pot_data.get('winners', []):
+                # Find the participant for this winner
+                participant_id = winner_data.get('participant_id')
+                if participant_id and participant_id in participant_objects:
+                    pot_winner = PotWinner(
+                        pot_id=pot.id,
+                        participant_id=participant_objects[participant_id].id,
+                        amount=winner_data['amount']
+                    )
+                    session.add(pot_winner)
+
+        return True
+
+    def store_hand(self, hand_data: Dict[str, Any]) -> bool:
+        """
+        Store a parsed hand in the database.
+
+        Args:
+            hand_data: Dictionary containing parsed hand data.
 
+        Returns:
+            True if the hand was added, False if it already existed or couldn't be stored.
+        """
+        session = self.get_session()
+        try:
+            added = self._add_hand(session, hand_data)
+            
             # Commit the transaction
             session.commit()
+            return added
                 
         except Exception as e:
             session.rollback()
             logger.error(f"Error storing hand {hand_data.get('hand_id')}: {e}")
+            return False
             
         finally:
             self.close_session(session)
 
-    def store_hands(self, hands: List[Dict[str, Any]]):
+    def store_hands_stream(self, hands: Iterable[Dict[str, Any]], batch_size: int = HAND_BATCH_SIZE) -> Tuple[int, int]:
+        """
+        Store hands from an iterator in a single transaction, in rolling batches.
+
+        After each batch the session is flushed and its objects are released, so
+        memory use is bounded by the batch size rather than the number of hands.
+        The transaction is committed once at the end; if anything fails it is
+        rolled back and the error is re-raised.
+
+        Args:
+            hands: Iterable of dictionaries containing parsed hand data.
+            batch_size: Number of hands to add between flushes.
+
+        Returns:
+            Tuple of the number of hands read from the iterator and the number of
+            hands added, which excludes hands that were already stored.
+        """
+        session = self.get_session()
+        try:
+            hand_count = 0
+            added_count = 0
+            for hand_data in hands:
+                if self._add_hand(session, hand_data):
+                    added_count += 1
+                hand_count += 1
+                if hand_count % batch_size == 0:
+                    session.flush()
+                    session.expunge_all()
+            
+            session.commit()
+            return hand_count, added_count
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            self.close_session(session)
+
+    def store_hands_bulk(self, parsed_files: List[Tuple[str, List[Dict[str, Any]], int]],
+                         batch_size: int = HAND_BATCH_SIZE):
+        """
+        Store the hands from several hand history files in a single transaction.
+
+        Every hand is added and every file is marked as processed in one session,
+        which is committed once at the end. As in store_hands_stream, the session is
+        flushed and its objects are released after each batch of hands. If anything
+        fails the whole call is rolled back and the error is re-raised, so the caller
+        can fall back to storing the files one at a time; callers should therefore
+        pass a limited number of files per call.
+
+        Args:
+            parsed_files: List of (file path, parsed hands, parsed byte offset) tuples.
+            batch_size: Number of hands to add between flushes.
+        """
+        session = self.get_session()
+        try:
+            hand_count = 0
+            hands_read = 0
+            file_records = []
+            for file_path, hands, last_offset in parsed_files:
+                added_count = 0
+                for hand_data in hands:
+                    if self._add_hand(session, hand_data):
+                        added_count += 1
+                    hands_read += 1
+                    if hands_read % batch_size == 0:
+                        session.flush()
+                        session.expunge_all()
+                hand_count += added_count
+                
+                if hands:
+                    file_records.append(
+                        self._hand_file_record(file_path, added_count, "processed", last_offset=last_offset)
+                    )
+                else:
+                    file_records.append(self._hand_file_record(
+                        file_path, 0, "no_hands", "No hands found in file", last_offset=last_offset
+                    ))
+            
+            session.flush()
+            self._upsert_hand_files(session, file_records)
+            session.commit()
+            logger.info(f"Stored {hand_count} hands from {len(parsed_files)} files")
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            self.close_session(session)
+
+    def store_hands(self, hands: List[Dict[str, Any]]) -> int:
         """
         Store multiple parsed hands in the database.
 
         Args:
             hands: List of dictionaries containing parsed hand data.
+
+        Returns:
+            Number of hands added, which excludes hands that were already stored.
         """
         # Initialize counters
         stats = {
@@ -556,6 +916,7 @@ class Database:
             'hands': 0,
             'actions': 0
         }
+        added_count = 0
         
         # Process each hand
         for hand_data in hands:
@@ -572,7 +933,8 @@ class Database:
             stats['actions'] += len(hand_data.get('actions', []))
             
             # Store the hand
-            self.store_hand(hand_data)
+            if self.store_hand(hand_data):
+                added_count += 1
 
         # Log summary in the requested order
         logger.info("Processing summary:")
@@ -588,3 +950,5 @@ class Database:
         logger.info(f"  - Unique Players: {len(stats['unique_players'])}")
         logger.info(f"  - Hands: {stats['hands']}")
         logger.info(f"  - Actions: {stats['actions']}")
+        
+        return added_count
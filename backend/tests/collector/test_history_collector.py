@@ -0,0 +1,102 @@
+"""
+Tests for storing the hands of a hand history file that is being written to.
+"""
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from backend.collector.history_collector import HandHistoryCollector
+from backend.parser.hand_parser import HandParser
+from backend.storage import database
+from backend.storage.database import Action, Hand, HandFile
+
+
+class TestHistoryCollector(unittest.TestCase):
+    """Test cases for HandHistoryCollector with a hand that is still being written."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        history_dir = Path(temp_dir.name) / "history"
+        history_dir.mkdir()
+        self.history_file = history_dir / "session.txt"
+
+        # Store the hands in a temporary SQLite database instead of the configured one
+        engine = create_engine(f"sqlite:///{Path(temp_dir.name) / 'poker_hud.db'}")
+        self.addCleanup(engine.dispose)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        for name, value in (("engine", engine), ("SessionLocal", self.SessionLocal)):
+            patcher = patch.object(database, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.collector = HandHistoryCollector(str(history_dir))
+
+        # PokerStars separates hands with blank lines
+        example_hands_dir = Path(__file__).parent.parent.parent / "example_hands"
+        self.walk = (example_hands_dir / "preflop-walk.txt").read_bytes().strip() + b"\n\n\n"
+        self.showdown = (example_hands_dir / "showdown.txt").read_bytes().strip() + b"\n\n\n"
+        self.showdown_actions = len(HandParser().parse_hand(self.showdown.decode('utf-8').strip())['actions'])
+
+    def write(self, data: bytes, mode: str = "wb"):
+        """Write data to the hand history file."""
+        with open(self.history_file, mode) as f:
+            f.write(data)
+
+    def stored_hand_ids(self):
+        """Get the IDs of the stored hands."""
+        with self.SessionLocal() as session:
+            return list(session.scalars(select(Hand.hand_id).order_by(Hand.hand_id)))
+
+    def stored_offset(self):
+        """Get the byte offset recorded for the hand history file."""
+        with self.SessionLocal() as session:
+            return session.scalar(select(HandFile.last_offset).where(HandFile.file_path == str(self.history_file)))
+
+    def assert_rest_of_hand_stored(self):
+        """Append the rest of the showdown hand and check that it is stored in full."""
+        self.write(self.showdown[len(self.showdown) // 2:], mode="ab")
+        self.collector.process_appended_hands(self.history_file)
+
+        self.assertEqual(self.stored_hand_ids(), ["255495032823", "255510109389"])
+        with self.SessionLocal() as session:
+            action_count = session.scalar(
+                select(func.count(Action.id)).join(Hand, Action.hand_id == Hand.id)
+                .where(Hand.hand_id == "255495032823")
+            )
+        self.assertEqual(action_count, self.showdown_actions)
+        self.assertEqual(self.stored_offset(), os.path.getsize(self.history_file))
+
+    def test_process_file_with_partial_hand(self):
+        """
+        Test that a hand still being written when a file is first processed is stored once it is complete.
+        """
+        self.write(self.walk + self.showdown[:len(self.showdown) // 2])
+
+        self.collector.process_file(self.history_file)
+        self.assertEqual(self.stored_hand_ids(), ["255510109389"])
+        self.assertEqual(self.stored_offset(), len(self.walk))
+
+        self.assert_rest_of_hand_stored()
+
+    def test_sync_with_partial_hand(self):
+        """
+        Test that a hand still being written when the directory is synced is stored once it is complete.
+        """
+        self.write(self.walk + self.showdown[:len(self.showdown) // 2])
+
+        self.assertEqual(self.collector.sync_history_files(), 1)
+        self.assertEqual(self.stored_hand_ids(), ["255510109389"])
+        self.assertEqual(self.stored_offset(), len(self.walk))
+
+        self.assert_rest_of_hand_stored()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""
+Tests for parsing the hands appended to a hand history file that is being written to.
+"""
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from backend.parser.hand_parser import HandParser
+
+
+class TestAppendedHands(unittest.TestCase):
+    """Test cases for HandParser.parse_appended_hands."""
+
+    def setUp(self):
+        """Set up the test environment."""
+        self.parser = HandParser()
+        example_hands_dir = Path(__file__).parent.parent.parent / "example_hands"
+
+        # PokerStars separates hands with blank lines
+        self.walk = (example_hands_dir / "preflop-walk.txt").read_bytes().strip() + b"\n\n\n"
+        self.showdown = (example_hands_dir / "showdown.txt").read_bytes().strip() + b"\n\n\n"
+        self.no_showdown = (example_hands_dir / "turn-no-showdown.txt").read_bytes().strip() + b"\n\n\n"
+
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.history_file = Path(temp_dir.name) / "session.txt"
+
+    def write(self, data: bytes, mode: str = "wb"):
+        """Write data to the hand history file."""
+        with open(self.history_file, mode) as f:
+            f.write(data)
+
+    def test_partial_hand_then_appended_data(self):
+        """
+        Test that a hand still being written is left for the next call, and parsed once it is complete.
+        """
+        split = len(self.showdown) // 2
+        self.write(self.walk + self.showdown[:split])
+
+        hands, offset = self.parser.parse_appended_hands(self.history_file, 0)
+        self.assertEqual([hand['hand_id'] for hand in hands], ["255510109389"])
+        self.assertEqual(offset, len(self.walk))
+
+        # Nothing new is complete yet, so the offset stays where it was
+        hands, unchanged_offset = self.parser.parse_appended_hands(self.history_file, offset)
+        self.assertEqual(hands, [])
+        self.assertEqual(unchanged_offset, offset)
+
+        # The rest of the hand is appended, along with the next hand
+        self.write(self.showdown[split:] + self.no_showdown, mode="ab")
+
+        hands, offset = self.parser.parse_appended_hands(self.history_file, offset)
+        self.assertEqual([hand['hand_id'] for hand in hands], ["255495032823", "255494991510"])
+        self.assertEqual(offset, os.path.getsize(self.history_file))
+
+    def test_truncated_file(self):
+        """
+        Test that a file that is now shorter than the offset is parsed from the start.
+        """
+        self.write(self.walk + self.showdown)
+        _, offset = self.parser.parse_appended_hands(self.history_file, 0)
+
+        self.write(self.no_showdown)
+        self.assertLess(os.path.getsize(self.history_file), offset)
+
+        hands, offset = self.parser.parse_appended_hands(self.history_file, offset)
+        self.assertEqual([hand['hand_id'] for hand in hands], ["255494991510"])
+        self.assertEqual(offset, len(self.no_showdown))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,31 +7,85 @@ import sys
 import unittest
 import tempfile
 from pathlib import Path
+from unittest.mock import patch
 from datetime import datetime
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
 
 # We don't need to modify the path if the package is installed in development mode
 # or if we run the tests from the right directory with the right PYTHONPATH
 
-from backend.poker_notes.db_utils import Base, User, Label, Note, get_database_session
-from backend.poker_notes.import_notes import import_notes_from_files
+from backend.poker_notes.db_utils import (
+    Base, User, Label, Note, migrate_database, migrate_note_timestamps, _get_session_maker
+)
+from backend.poker_notes.import_notes import import_notes_from_files, parse_xml_files
 from backend.poker_notes.export_notes import export_notes_to_file
 
 
+def create_memory_engine():
+    """
+    Create an in-memory SQLite engine that supports SAVEPOINTs.
+
+    A single connection is shared by every session, and pysqlite's own transaction
+    handling is disabled so that SQLAlchemy emits BEGIN itself.
+    """
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+
+    @event.listens_for(engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def do_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    # The database is always empty, so skip the per-table existence checks
+    Base.metadata.create_all(engine, checkfirst=False)
+    return engine
+
+
+def clone_database(source_engine, target_engine):
+    """
+    Copy a SQLite database into another with the sqlite3 backup API.
+
+    The copy is done page by page in C, so no rows pass through Python.
+    """
+    source = source_engine.raw_connection()
+    target = target_engine.raw_connection()
+    try:
+        source.connection.backup(target.connection)
+    finally:
+        source.close()
+        target.close()
+
+
 class TestImportExport(unittest.TestCase):
     """Test cases for import and export functionality."""
 
+    @classmethod
+    def setUpClass(cls):
+        """Create the database schema once for all tests."""
+        cls.engine = create_memory_engine()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Dispose of the shared engine."""
+        cls.engine.dispose()
+
     def setUp(self):
         """Set up test fixtures."""
-        # Create a temporary database
-        self.temp_db = tempfile.NamedTemporaryFile(delete=False, suffix=".db")
-        self.temp_db.close()
-        self.database_url = f"sqlite:///{self.temp_db.name}"
-        
-        # Create the database schema
-        engine = create_engine(self.database_url)
-        Base.metadata.create_all(engine)
+        # Run each test inside a transaction that is rolled back in tearDown.
+        # Commits made by the importer only release a SAVEPOINT, which is restarted here.
+        self.connection = self.engine.connect()
+        self.transaction = self.connection.begin()
+        self.session = Session(bind=self.connection)
+        self.nested = self.connection.begin_nested()
+
+        @event.listens_for(self.session, "after_transaction_end")
+        def restart_savepoint(session, transaction):
+            if not self.nested.is_active:
+                self.nested = self.connection.begin_nested()
         
         # Create a sample XML file
         self.sample_xml = """<?xml version="1.0" encoding="UTF-8"?>
@@ -63,8 +117,12 @@ Willing to triple barrel bluff and get it all in on river (over-betting pot)</no
 
     def tearDown(self):
         """Tear down test fixtures."""
+        # Discard everything the test wrote to the database
+        self.session.close()
+        self.transaction.rollback()
+        self.connection.close()
+        
         # Remove temporary files
-        os.unlink(self.temp_db.name)
         os.unlink(self.temp_xml.name)
         if os.path.exists(self.export_file.name):
             os.unlink(self.export_file.name)
@@ -72,49 +130,63 @@ Willing to triple barrel bluff and get it all in on river (over-betting pot)</no
     def test_import_notes(self):
         """Test importing notes from an XML file."""
         # Import notes from the sample XML file
-        imported_count = import_notes_from_files("testuser", [self.temp_xml.name], self.database_url)
+        imported_count = import_notes_from_files("testuser", [self.temp_xml.name], session=self.session)
         
         # Check that notes were imported
         self.assertEqual(imported_count, 4)
         
         # Check the database contents
-        session, _ = get_database_session(self.database_url)
-        try:
-            # Check user
-            user = session.query(User).filter_by(username="testuser").first()
-            self.assertIsNotNone(user)
-            
-            # Check labels
-            labels = session.query(Label).filter_by(user_id=user.id).all()
-            self.assertEqual(len(labels), 8)
-            
-            # Check notes
-            notes = session.query(Note).filter_by(user_id=user.id).all()
-            self.assertEqual(len(notes), 4)
-            
-            # Check specific notes
-            note_players = [note.player_name for note in notes]
-            self.assertIn("#VILÃO!90", note_players)
-            self.assertIn("(CartmanBrah)-s", note_players)
-            self.assertIn("+ Time Passing", note_players)
-            self.assertIn("Player's Name", note_players)
-            
-            # Check note content
-            for note in notes:
-                if note.player_name == "(CartmanBrah)-s":
-                    self.assertEqual(note.content, "flat-called in MP with KK after EP bet with 25BB")
-                elif note.player_name == "Player's Name":
-                    self.assertEqual(note.content, "Contains apostrophe & ampersand")
-        finally:
-            session.close()
+        session = self.session
+        
+        # Check user
+        user = session.query(User).filter_by(username="testuser").first()
+        self.assertIsNotNone(user)
+        
+        # Check labels
+        labels = session.query(Label).filter_by(user_id=user.id).all()
+        self.assertEqual(len(labels), 8)
+        
+        # Check notes
+        notes = session.query(Note).filter_by(user_id=user.id).all()
+        self.assertEqual(len(notes), 4)
+        
+        # Check specific notes
+        note_players = [note.player_name for note in notes]
+        self.assertIn("#VILÃO!90", note_players)
+        self.assertIn("(CartmanBrah)-s", note_players)
+        self.assertIn("+ Time Passing", note_players)
+        self.assertIn("Player's Name", note_players)
+        
+        # Check note content
+        for note in notes:
+            if note.player_name == "(CartmanBrah)-s":
+                self.assertEqual(note.content, "flat-called in MP with KK after EP bet with 25BB")
+            elif note.player_name == "Player's Name":
+                self.assertEqual(note.content, "Contains apostrophe & ampersand")
+
+    def test_import_unchanged_labels(self):
+        """Test that importing the same label set again skips the label sync."""
+        import_notes_from_files("testuser", [self.temp_xml.name], session=self.session)
+        user = self.session.query(User).filter_by(username="testuser").first()
+        self.assertIsNotNone(user.labels_hash)
+        
+        with patch("backend.poker_notes.import_notes.import_labels") as import_labels:
+            imported_count = import_notes_from_files("testuser", [self.temp_xml.name], session=self.session)
+        import_labels.assert_not_called()
+        # The notes are unchanged as well, so none are imported again
+        self.assertEqual(imported_count, 0)
+        
+        # Notes are still linked to the labels stored by the first import
+        note = self.session.query(Note).filter_by(user_id=user.id, player_name="Player's Name").one()
+        self.assertEqual(note.label.name, "Bad player")
 
     def test_export_notes(self):
         """Test exporting notes to an XML file."""
         # First import notes to have something to export
-        import_notes_from_files("testuser", [self.temp_xml.name], self.database_url)
+        import_notes_from_files("testuser", [self.temp_xml.name], session=self.session)
         
         # Export notes
-        success = export_notes_to_file("testuser", self.export_file.name, self.database_url)
+        success = export_notes_to_file("testuser", self.export_file.name, session=self.session)
         self.assertTrue(success)
         
         # Check that the export file exists and has content
@@ -136,30 +208,23 @@ Willing to triple barrel bluff and get it all in on river (over-betting pot)</no
     def test_import_export_round_trip(self):
         """Test a full round trip of import and export."""
         # Import notes
-        import_notes_from_files("testuser", [self.temp_xml.name], self.database_url)
+        import_notes_from_files("testuser", [self.temp_xml.name], session=self.session)
         
         # Export notes
-        export_notes_to_file("testuser", self.export_file.name, self.database_url)
-        
-        # Create a new temporary database for the round trip test
-        round_trip_db = tempfile.NamedTemporaryFile(delete=False, suffix=".db")
-        round_trip_db.close()
-        round_trip_db_url = f"sqlite:///{round_trip_db.name}"
+        export_notes_to_file("testuser", self.export_file.name, session=self.session)
         
-        # Create the database schema
-        engine = create_engine(round_trip_db_url)
-        Base.metadata.create_all(engine)
+        # Create a new in-memory database for the round trip test
+        round_trip_engine = create_memory_engine()
         
         try:
             # Import the exported notes into the new database
-            imported_count = import_notes_from_files("testuser", [self.export_file.name], round_trip_db_url)
-            
-            # Check that all notes were imported
-            self.assertEqual(imported_count, 4)
-            
-            # Check the database contents
-            session, _ = get_database_session(round_trip_db_url)
+            session = Session(bind=round_trip_engine)
             try:
+                imported_count = import_notes_from_files("testuser", [self.export_file.name], session=session)
+                
+                # Check that all notes were imported
+                self.assertEqual(imported_count, 4)
+                
                 # Check notes
                 notes = session.query(Note).filter(
                     Note.user_id == session.query(User.id).filter_by(username="testuser").scalar()
@@ -182,12 +247,48 @@ Willing to triple barrel bluff and get it all in on river (over-betting pot)</no
             finally:
                 session.close()
         finally:
-            os.unlink(round_trip_db.name)
+            round_trip_engine.dispose()
+
+    def test_database_clone(self):
+        """Test that imported notes survive a page-level copy of the database."""
+        # Import into a separate database that is actually committed; a backup of the
+        # shared engine would block on the transaction every test holds open
+        source_engine = create_memory_engine()
+        clone_engine = create_engine("sqlite://", poolclass=StaticPool)
+        try:
+            session = Session(bind=source_engine)
+            try:
+                import_notes_from_files("testuser", [self.temp_xml.name], session=session)
+            finally:
+                session.close()
+            
+            # Copy the database without going through XML
+            clone_database(source_engine, clone_engine)
+            
+            session = Session(bind=clone_engine)
+            try:
+                user = session.query(User).filter_by(username="testuser").first()
+                self.assertIsNotNone(user)
+                
+                # Check labels and notes
+                self.assertEqual(session.query(Label).filter_by(user_id=user.id).count(), 8)
+                notes = {note.player_name: note for note in session.query(Note).filter_by(user_id=user.id)}
+                self.assertEqual(
+                    set(notes),
+                    {"#VILÃO!90", "(CartmanBrah)-s", "+ Time Passing", "Player's Name"}
+                )
+                self.assertEqual(notes["Player's Name"].content, "Contains apostrophe & ampersand")
+                self.assertEqual(notes["(CartmanBrah)-s"].last_updated, 1705178160)
+            finally:
+                session.close()
+        finally:
+            source_engine.dispose()
+            clone_engine.dispose()
 
     def test_note_merging(self):
         """Test that notes are properly merged when importing multiple times."""
         # Import notes from the sample XML file
-        import_notes_from_files("testuser", [self.temp_xml.name], self.database_url)
+        import_notes_from_files("testuser", [self.temp_xml.name], session=self.session)
         
         # Create a second XML file with updated notes for the same players
         second_xml = """<?xml version="1.0" encoding="UTF-8"?>
@@ -212,40 +313,109 @@ Willing to triple barrel bluff and get it all in on river (over-betting pot)</no
         
         try:
             # Import the second XML file
-            imported_count = import_notes_from_files("testuser", [second_xml_file.name], self.database_url)
+            imported_count = import_notes_from_files("testuser", [second_xml_file.name], session=self.session)
             
             # Check that notes were imported (2 new notes)
             self.assertEqual(imported_count, 2)
             
             # Check the database contents
-            session, _ = get_database_session(self.database_url)
-            try:
-                # Check user
-                user = session.query(User).filter_by(username="testuser").first()
-                self.assertIsNotNone(user)
-                
-                # Check notes
-                notes = session.query(Note).filter_by(user_id=user.id).all()
-                # Should now have 5 notes (4 original + 1 new player)
-                self.assertEqual(len(notes), 5)
-                
-                # Check specific notes
-                for note in notes:
-                    if note.player_name == "#VILÃO!90":
-                        # Note should be merged with the new content
-                        self.assertIn("New note content for VILÃO", note.content)
-                        # Verify that a label exists, but don't check the exact ID
-                        # This makes the test more robust against implementation changes
-                        self.assertIsNotNone(note.label_id)
-                    elif note.player_name == "NewPlayer":
-                        self.assertEqual(note.content, "Note for a new player")
-                        # Verify that a label exists, but don't check the exact ID
-                        self.assertIsNotNone(note.label_id)
-            finally:
-                session.close()
+            session = self.session
+            
+            # Check user
+            user = session.query(User).filter_by(username="testuser").first()
+            self.assertIsNotNone(user)
+            
+            # Check notes
+            notes = session.query(Note).filter_by(user_id=user.id).all()
+            # Should now have 5 notes (4 original + 1 new player)
+            self.assertEqual(len(notes), 5)
+            
+            # Check specific notes
+            for note in notes:
+                if note.player_name == "#VILÃO!90":
+                    # Note should be merged with the new content
+                    self.assertIn("New note content for VILÃO", note.content)
+                    # Verify that a label exists, but don't check the exact ID
+                    # This makes the test more robust against implementation changes
+                    self.assertIsNotNone(note.label_id)
+                elif note.player_name == "NewPlayer":
+                    self.assertEqual(note.content, "Note for a new player")
+                    # Verify that a label exists, but don't check the exact ID
+                    self.assertIsNotNone(note.label_id)
+        finally:
+            os.unlink(second_xml_file.name)
+
+    def test_parse_xml_files_cache(self):
+        """Test that files parsed in worker processes are cached in this process."""
+        second_xml_file = tempfile.NamedTemporaryFile(delete=False, suffix=".xml")
+        second_xml_file.write(self.sample_xml.replace("Conservative", "Tight").encode('utf-8'))
+        second_xml_file.close()
+        try:
+            file_paths = [self.temp_xml.name, second_xml_file.name]
+            results = parse_xml_files(file_paths)
+            self.assertEqual(results[0][0][0]["name"], "Conservative")
+            self.assertEqual(results[1][0][0]["name"], "Tight")
+            self.assertEqual([len(notes) for _, notes in results], [4, 4])
+            
+            # Unchanged files are taken from the cache instead of being parsed again
+            for (cached_labels, cached_notes), (labels, notes) in zip(parse_xml_files(file_paths), results):
+                self.assertIs(cached_labels, labels)
+                self.assertIs(cached_notes, notes)
         finally:
             os.unlink(second_xml_file.name)
 
 
+    def test_migrate_note_timestamps(self):
+        """Test that DATETIME strings written by older versions are converted to Unix timestamps."""
+        engine = create_memory_engine()
+        try:
+            legacy_value = datetime.fromtimestamp(1685233626).strftime("%Y-%m-%d %H:%M:%S.%f")
+            with engine.begin() as conn:
+                conn.execute(
+                    text("INSERT INTO notes (player_name, last_updated) VALUES ('legacy', :ts), ('current', 1705178160)"),
+                    {"ts": legacy_value}
+                )
+            
+            migrate_note_timestamps(engine)
+            
+            with engine.connect() as conn:
+                rows = dict(conn.execute(text("SELECT player_name, last_updated FROM notes")).all())
+            self.assertEqual(rows, {"legacy": 1685233626, "current": 1705178160})
+        finally:
+            engine.dispose()
+
+    def test_migrate_database(self):
+        """Test that the labels_hash column is added to a users table created by an older version."""
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR UNIQUE, created_at DATETIME)"
+                ))
+                conn.execute(text("INSERT INTO users (username) VALUES ('legacy')"))
+            Base.metadata.create_all(engine)
+            
+            migrate_database(engine)
+            # Running it again leaves the database as it is
+            migrate_database(engine)
+            
+            self.assertIn("labels_hash", [column["name"] for column in inspect(engine).get_columns("users")])
+            with engine.connect() as conn:
+                rows = conn.execute(text("SELECT username, labels_hash FROM users")).all()
+            self.assertEqual([tuple(row) for row in rows], [("legacy", None)])
+        finally:
+            engine.dispose()
+
+    def test_session_maker_cached(self):
+        """Test that the engine for a database URL is only created and migrated once."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            database_url = f"sqlite:///{Path(temp_dir) / 'notes.db'}"
+            with patch("backend.poker_notes.db_utils.migrate_database") as migrate:
+                session_maker = _get_session_maker(database_url)
+                self.assertIs(_get_session_maker(database_url), session_maker)
+            migrate.assert_called_once()
+            session_maker.kw["bind"].dispose()
+
+
 if __name__ == "__main__":
     unittest.main()
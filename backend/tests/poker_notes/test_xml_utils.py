@@ -3,24 +3,24 @@
 Tests for XML utilities for poker notes management.
 """
 import os
+import shutil
 import sys
 import unittest
 import tempfile
 from datetime import datetime
 from pathlib import Path
+from unittest.mock import patch
 
 # We don't need to modify the path if the package is installed in development mode
 # or if we run the tests from the right directory with the right PYTHONPATH
 
-from backend.poker_notes.xml_utils import parse_xml_file, generate_xml, write_xml_to_file
+from backend.poker_notes.xml_utils import (
+    HAS_LXML, parse_xml_file, parse_xml_file_columns, parse_labels_only, generate_xml, write_xml_to_file,
+    export_notes_stream, _parse_notes_fast, _parse_notes_parallel
+)
 
-
-class TestXmlUtils(unittest.TestCase):
-    """Test cases for XML utilities."""
-
-    def setUp(self):
-        """Set up test fixtures."""
-        self.sample_xml = """<?xml version="1.0" encoding="UTF-8"?>
+# Sample notes file, encoded once for writing
+_SAMPLE_XML = """<?xml version="1.0" encoding="UTF-8"?>
 <notes version="1">
     <labels>
         <label id="0" color="30DBFF">Conservative</label>
@@ -39,19 +39,41 @@ Willing to triple barrel bluff and get it all in on river (over-betting pot)</no
     <note player="Player&apos;s Name" label="4" update="1705699680">Contains apostrophe &amp; ampersand</note>
 </notes>
 """
-        # Create a temporary file with the sample XML
-        self.temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".xml")
-        self.temp_file.write(self.sample_xml.encode('utf-8'))
-        self.temp_file.close()
+_SAMPLE_XML_BYTES = _SAMPLE_XML.encode("utf-8")
+
+# Note timestamps as datetimes, which generate_xml accepts as well as Unix timestamps
+_TS1 = datetime.fromtimestamp(1685233626)
+_TS2 = datetime.fromtimestamp(1705178160)
+_TS3 = datetime.fromtimestamp(1705699680)
+_TS4 = datetime.fromtimestamp(1743283440)
+
+
+class TestXmlUtils(unittest.TestCase):
+    """Test cases for XML utilities."""
 
-    def tearDown(self):
-        """Tear down test fixtures."""
-        # Remove the temporary file
-        os.unlink(self.temp_file.name)
+    @classmethod
+    def setUpClass(cls):
+        """Set up test fixtures shared by all tests."""
+        # Create a temporary directory for every file the tests use, and write the
+        # sample XML to it once; tests only read the sample file
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.sample_file = os.path.join(cls.temp_dir, "sample.xml")
+        with open(cls.sample_file, 'wb', buffering=0) as f:
+            f.write(_SAMPLE_XML_BYTES)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Tear down test fixtures shared by all tests."""
+        # Remove the temporary directory and everything written to it
+        shutil.rmtree(cls.temp_dir)
+
+    def temp_path(self, name):
+        """Get a path in the temporary directory for a file written by a test."""
+        return os.path.join(self.temp_dir, name)
 
     def test_parse_xml_file(self):
         """Test parsing an XML file."""
-        labels, notes = parse_xml_file(self.temp_file.name)
+        labels, notes = parse_xml_file(self.sample_file)
         
         # Check labels
         self.assertEqual(len(labels), 8)
@@ -68,6 +90,108 @@ Willing to triple barrel bluff and get it all in on river (over-betting pot)</no
         self.assertEqual(notes[3]["player"], "Player's Name")
         self.assertEqual(notes[3]["content"], "Contains apostrophe & ampersand")
 
+    def test_parse_xml_file_cache(self):
+        """Test that parsing is cached until the file changes."""
+        # Work on a copy, since the file is rewritten
+        file_path = self.temp_path("cache.xml")
+        shutil.copyfile(self.sample_file, file_path)
+        
+        labels, notes = parse_xml_file(file_path)
+        self.assertIs(parse_xml_file(file_path)[1], notes)
+        
+        # Rewrite the file with a single note, which changes its size
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write('<notes version="1"><note player="NewPlayer" label="3" update="1705178200">New</note></notes>')
+        
+        labels, notes = parse_xml_file(file_path)
+        self.assertEqual(len(labels), 0)
+        self.assertEqual(len(notes), 1)
+        self.assertEqual(notes[0]["player"], "NewPlayer")
+
+    def test_parse_xml_file_columns(self):
+        """Test parsing an XML file into note columns."""
+        labels, columns = parse_xml_file_columns(self.sample_file)
+        
+        # Labels are the same as with parse_xml_file
+        self.assertEqual(labels, parse_xml_file(self.sample_file)[0])
+        
+        # Check note columns
+        self.assertEqual(columns["player"], ["#VILÃO!90", "(CartmanBrah)-s", "+ Time Passing", "Player's Name"])
+        self.assertEqual(list(columns["label_id"]), [6, 0, 6, 4])
+        self.assertEqual(list(columns["updated"]), [1685233626, 1705178160, 1743283440, 1705699680])
+        self.assertEqual(columns["content"][0], "")
+        self.assertEqual(columns["content"][3], "Contains apostrophe & ampersand")
+
+    def test_parse_notes_fast(self):
+        """Test that files in another layout than PokerStars writes are left to the XML parser."""
+        labels, columns = _parse_notes_fast(self.sample_file)
+        self.assertEqual(labels, parse_labels_only(self.sample_file))
+        self.assertEqual(columns["player"], ["#VILÃO!90", "(CartmanBrah)-s", "+ Time Passing", "Player's Name"])
+        self.assertEqual(list(columns["label_id"]), [6, 0, 6, 4])
+        self.assertEqual(columns["content"][3], "Contains apostrophe & ampersand")
+        
+        # Reading the notes in blocks of a few bytes gives the same result
+        with patch("backend.poker_notes.xml_utils.IO_BUFFER_SIZE", 16):
+            self.assertEqual(_parse_notes_fast(self.sample_file), (labels, columns))
+        
+        layouts = {
+            "single_quotes": "<notes><note player='A' label='1' update='1'>Text</note></notes>",
+            "attribute_order": '<notes><note label="1" player="A" update="1">Text</note></notes>',
+            "comment": '<notes><!-- comment --><note player="A" label="1" update="1">Text</note></notes>',
+            "character_reference": '<notes><note player="A" label="1" update="1">Line&#10;Text</note></notes>',
+            "text_between_notes": '<notes><note player="A" label="1" update="1">Text</note>Text</notes>'
+        }
+        for name, xml in layouts.items():
+            with self.subTest(layout=name):
+                file_path = self.temp_path(f"{name}.xml")
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(xml)
+                
+                self.assertIsNone(_parse_notes_fast(file_path))
+                self.assertEqual(parse_xml_file_columns(file_path)[1]["player"], ["A"])
+
+    @unittest.skipUnless(HAS_LXML, "parallel parsing requires lxml")
+    def test_parse_notes_parallel(self):
+        """Test that parsing in chunks on several threads gives the same result as parsing serially."""
+        labels, columns = parse_xml_file_columns(self.sample_file)
+        for workers in (1, 2, 3):
+            with self.subTest(workers=workers):
+                parallel_labels, parallel_columns = _parse_notes_parallel(self.sample_file, workers)
+                self.assertEqual(parallel_labels, labels)
+                self.assertEqual(parallel_columns, columns)
+        
+        # A note end tag inside a CDATA section can't be split on, so the file is left to the serial parser
+        file_path = self.temp_path("cdata.xml")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write('<notes version="1"><note player="A" label="1" update="1"><![CDATA[</note>]]></note>'
+                    '<note player="B" label="2" update="2">Text</note></notes>')
+        
+        self.assertIsNone(_parse_notes_parallel(file_path, 2))
+        self.assertEqual(parse_xml_file_columns(file_path)[1]["content"], ["</note>", "Text"])
+        
+        # Labels are only read from before the first note, so a label between notes is left to the serial parser too
+        file_path = self.temp_path("late_label.xml")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write('<notes version="1"><labels><label id="1" color="30DBFF">Fish</label></labels>'
+                    '<note player="A" label="1" update="1">Text</note>'
+                    '<labels><label id="2" color="FF0000">Reg</label></labels>'
+                    '<note player="B" label="2" update="2">Text</note></notes>')
+        
+        self.assertIsNone(_parse_notes_parallel(file_path, 2))
+        self.assertEqual(sorted(parse_xml_file_columns(file_path)[0]), [1, 2])
+
+    def test_parse_labels_only(self):
+        """Test parsing only the labels of an XML file."""
+        labels = parse_labels_only(self.sample_file)
+        self.assertEqual(labels, parse_xml_file(self.sample_file)[0])
+        
+        # Parsing stops before the notes, so a broken note doesn't matter
+        file_path = self.temp_path("broken_note.xml")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write('<notes version="1"><labels><label id="1" color="30FF97">Solid</label></labels><note')
+        
+        self.assertEqual(parse_labels_only(file_path), {1: {"id": 1, "color": "30FF97", "name": "Solid"}})
+
     def test_generate_xml(self):
         """Test generating XML from data."""
         labels = [
@@ -80,13 +204,13 @@ Willing to triple barrel bluff and get it all in on river (over-betting pot)</no
                 "player_name": "#VILÃO!90",
                 "label_id": 6,
                 "content": "",
-                "last_updated": datetime.fromtimestamp(1685233626)
+                "last_updated": _TS1
             },
             {
                 "player_name": "(CartmanBrah)-s",
                 "label_id": 0,
                 "content": "flat-called in MP with KK after EP bet with 25BB",
-                "last_updated": datetime.fromtimestamp(1705178160)
+                "last_updated": _TS2
             }
         ]
         
@@ -123,28 +247,25 @@ Willing to triple barrel bluff and get it all in on river (over-betting pot)</no
                 "player_name": "#VILÃO!90",
                 "label_id": 6,
                 "content": "",
-                "last_updated": datetime.fromtimestamp(1685233626)
+                "last_updated": _TS1
             },
             {
                 "player_name": "Player's Name",
                 "label_id": 4,
                 "content": "Contains apostrophe & ampersand",
-                "last_updated": datetime.fromtimestamp(1705699680)
+                "last_updated": _TS3
             }
         ]
         
         root = generate_xml("testuser", labels, notes)
         
-        # Create a temporary file for the output
-        output_file = tempfile.NamedTemporaryFile(delete=False, suffix=".xml")
-        output_file.close()
-        
-        # Write the XML to the file
-        success = write_xml_to_file(root, output_file.name)
+        # Write the XML to a file in the temporary directory
+        output_file = self.temp_path("write.xml")
+        success = write_xml_to_file(root, output_file)
         self.assertTrue(success)
         
         # Read the file and check its contents
-        with open(output_file.name, 'r', encoding='utf-8') as f:
+        with open(output_file, 'r', encoding='utf-8') as f:
             content = f.read()
         
         # Check that the file contains the expected content
@@ -154,8 +275,53 @@ Willing to triple barrel bluff and get it all in on river (over-betting pot)</no
         self.assertIn('<note player="#VILÃO!90" label="6" update="1685233626"></note>', content)
         self.assertIn('Contains apostrophe &amp; ampersand', content)
         
-        # Clean up
-        os.unlink(output_file.name)
+        # Check that nothing is written as a self-closing tag or escaped twice
+        self.assertNotIn('/>', content)
+        self.assertNotIn('&amp;amp;', content)
+
+    def test_write_xml_to_file_layout(self):
+        """Test the exact layout of a written file, indented with tabs as PokerStars does."""
+        notes = [
+            {
+                "player_name": "#VILÃO!90",
+                "label_id": 6,
+                "content": "",
+                "last_updated": 1685233626
+            },
+            {
+                "player_name": "(CartmanBrah)-s",
+                "label_id": 0,
+                "content": "flat-called in MP with KK after EP bet with 25BB",
+                "last_updated": 1705178160
+            }
+        ]
+        
+        root = generate_xml("testuser", [], notes)
+        
+        # Write the XML to a file in the temporary directory
+        output_file = self.temp_path("layout.xml")
+        self.assertTrue(write_xml_to_file(root, output_file))
+        with open(output_file, 'r', encoding='utf-8', newline='') as f:
+            content = f.read()
+        
+        self.assertEqual(content, (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<notes version="1">\n'
+            '\t<labels>\n'
+            '\t\t<label id="0" color="30DBFF">Conservative</label>\n'
+            '\t\t<label id="1" color="30FF97">Solid</label>\n'
+            '\t\t<label id="2" color="E1FF80">Neutral</label>\n'
+            '\t\t<label id="3" color="FF9B30">Custom Label 4</label>\n'
+            '\t\t<label id="4" color="FF304E">Bad player</label>\n'
+            '\t\t<label id="5" color="FF30D7">Aggressive</label>\n'
+            '\t\t<label id="6" color="303EFF">Reckless</label>\n'
+            '\t\t<label id="7" color="1985FF">Loose</label>\n'
+            '\t</labels>\n'
+            '\t<note player="#VILÃO!90" label="6" update="1685233626"></note>\n'
+            '\t<note player="(CartmanBrah)-s" label="0" update="1705178160">'
+            'flat-called in MP with KK after EP bet with 25BB</note>\n'
+            '</notes>\n'
+        ))
 
     def test_special_characters_handling(self):
         """Test handling of special characters in player names and note content."""
@@ -166,39 +332,36 @@ Willing to triple barrel bluff and get it all in on river (over-betting pot)</no
                 "player_name": "#VILÃO!90",
                 "label_id": 6,
                 "content": "",
-                "last_updated": datetime.fromtimestamp(1685233626)
+                "last_updated": _TS1
             },
             {
                 "player_name": "(CartmanBrah)-s",
                 "label_id": 0,
                 "content": "flat-called in MP with KK after EP bet with 25BB",
-                "last_updated": datetime.fromtimestamp(1705178160)
+                "last_updated": _TS2
             },
             {
                 "player_name": "+ Time Passing",
                 "label_id": 6,
                 "content": "Reckless. Limper. Aggressive.",
-                "last_updated": datetime.fromtimestamp(1743283440)
+                "last_updated": _TS4
             },
             {
                 "player_name": "Player's Name",
                 "label_id": 4,
                 "content": "Contains apostrophe & ampersand < > \"quotes\"",
-                "last_updated": datetime.fromtimestamp(1705699680)
+                "last_updated": _TS3
             }
         ]
         
         root = generate_xml("testuser", labels, notes)
         
-        # Create a temporary file for the output
-        output_file = tempfile.NamedTemporaryFile(delete=False, suffix=".xml")
-        output_file.close()
-        
-        # Write the XML to the file
-        write_xml_to_file(root, output_file.name)
+        # Write the XML to a file in the temporary directory
+        output_file = self.temp_path("special_characters.xml")
+        write_xml_to_file(root, output_file)
         
         # Read the file and check its contents
-        with open(output_file.name, 'r', encoding='utf-8') as f:
+        with open(output_file, 'r', encoding='utf-8') as f:
             content = f.read()
         
         # Check that special characters in player names are preserved
@@ -210,9 +373,59 @@ Willing to triple barrel bluff and get it all in on river (over-betting pot)</no
         # Check that special characters in content are properly encoded
         # Note: apostrophes in player names are preserved as-is, while other special characters are encoded
         self.assertIn('Contains apostrophe &amp; ampersand &lt; &gt; &quot;quotes&quot;', content)
+
+    def test_export_notes_stream(self):
+        """Test that streaming notes to a file matches generating and writing the tree."""
+        notes = [
+            {
+                "player_name": "#VILÃO!90",
+                "label_id": 6,
+                "content": "",
+                "last_updated": _TS1
+            },
+            {
+                "player_name": "",
+                "label_id": 2,
+                "content": "Skipped, no player name",
+                "last_updated": 1705178160
+            },
+            {
+                "player_name": "Player's Name",
+                "label_id": 9,
+                "content": "Contains apostrophe & ampersand < > \"quotes\"",
+                "last_updated": 1705699680
+            }
+        ]
+        
+        # Write both outputs to files in the temporary directory
+        tree_file = self.temp_path("tree.xml")
+        stream_file = self.temp_path("stream.xml")
+        write_xml_to_file(generate_xml("testuser", [], notes), tree_file)
+        note_count = export_notes_stream("testuser", [], iter(notes), stream_file)
+        self.assertEqual(note_count, 2)
+        
+        with open(tree_file, 'rb') as f:
+            expected = f.read()
+        with open(stream_file, 'rb') as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_export_notes_stream_failure(self):
+        """Test that an export failing part way leaves the existing file untouched."""
+        file_path = self.temp_path("existing_notes.xml")
+        shutil.copyfile(self.sample_file, file_path)
+        
+        def failing_notes():
+            yield {"player_name": "Player", "label_id": 1, "content": "Note", "last_updated": 1705178160}
+            raise RuntimeError("Database connection lost")
+        
+        with self.assertRaises(RuntimeError):
+            export_notes_stream("testuser", [], failing_notes(), file_path)
+        
+        with open(file_path, 'rb') as f:
+            self.assertEqual(f.read(), _SAMPLE_XML_BYTES)
         
-        # Clean up
-        os.unlink(output_file.name)
+        # The temporary file is removed
+        self.assertEqual([name for name in os.listdir(self.temp_dir) if name.endswith(".tmp")], [])
 
 
 if __name__ == "__main__":
@@ -3,14 +3,11 @@ Main entry point for the Poker Hud application.
 """
 import argparse
 import logging
+import os
+import signal
 import sys
-import time
 from pathlib import Path
 
-from backend.collector.history_collector import HandHistoryCollector
-from backend.parser.hand_parser import HandParser
-from backend.storage.database import Database
-
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,  # Set to INFO to reduce verbosity
@@ -32,6 +29,9 @@ def sync_command(args):
     """
     logger.info("Starting hand history sync")
     
+    from backend.collector.history_collector import HandHistoryCollector
+    from backend.storage.database import Database
+    
     # Initialize the database and ensure tables exist
     db = Database()
     logger.info("Creating database tables if they don't exist")
@@ -87,6 +87,8 @@ def monitor_command(args):
     """
     logger.info("Starting Poker Hud monitoring service")
 
+    from backend.collector.history_collector import HandHistoryCollector
+
     # Initialize and start the hand history collector
     collector = HandHistoryCollector(args.history_path)
 
@@ -119,13 +121,15 @@ def monitor_command(args):
     )
     api_thread.start()
 
-    # Keep the application running
+    # Keep the application running until Ctrl+C or a termination signal sets the stop event
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
     logger.info("Poker Hud is running. Press Ctrl+C to exit.")
     try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        logger.info("Keyboard interrupt received")
+        stop_event.wait()
+        logger.info("Shutdown signal received")
     finally:
         # Clean up
         collector.stop_monitoring()
@@ -138,6 +142,8 @@ def parse_command(args):
     """
     logger.info(f"Parsing hand history file: {args.file}")
 
+    from backend.parser.hand_parser import HandParser
+
     # Initialize the parser
     parser = HandParser()
 
@@ -164,6 +170,8 @@ def init_db_command(args):
     """
     logger.info("Initializing database")
 
+    from backend.storage.database import Database
+
     # Initialize the database
     db = Database()
 
@@ -178,20 +186,27 @@ def api_command(args):
 
     # Start the API server
     import uvicorn
-    from backend.api.stats_api import app
 
-    api_host = args.api_host
-    api_port = args.api_port
+    api_host = args.host
+    api_port = args.port
+    workers = args.workers or os.cpu_count() or 1
 
-    logger.info(f"Starting API server at http://{api_host}:{api_port}")
+    logger.info(f"Starting API server at http://{api_host}:{api_port} with {workers} workers")
     logger.info("Poker Hud API is running. Press Ctrl+C to exit.")
     
     try:
+        # The app is passed as an import string so each worker process imports it
+        # (and opens its own database connections). "auto" picks uvloop and
+        # httptools when they are installed, and falls back on platforms such as
+        # Windows where uvloop is unavailable
         uvicorn.run(
-            app=app,
+            app="backend.api.stats_api:app",
             host=api_host,
             port=api_port,
-            log_level="info"
+            log_level="info",
+            loop="auto",
+            http="auto",
+            workers=workers
         )
     except KeyboardInterrupt:
         logger.info("Keyboard interrupt received")
@@ -205,35 +220,54 @@ def check_db_command(args):
     """
     logger.info("Checking database contents")
     
+    from backend.storage.database import Database
+    
     # Initialize the database
     db = Database()
     
     # Get a session
     session = db.get_session()
     try:
-        from backend.storage.database import Hand, HandParticipant, Player, Action, Winner
+        from sqlalchemy import select, text
+        from sqlalchemy.orm import selectinload
+        from backend.storage.database import Hand, HandParticipant, Pot, PotWinner
         
-        # Count records in each table
-        hand_count = session.query(Hand).count()
-        participant_count = session.query(HandParticipant).count()
-        player_count = session.query(Player).count()
-        action_count = session.query(Action).count()
-        winner_count = session.query(Winner).count()
+        # Count records in each table in a single query
+        counts = session.execute(text(
+            "SELECT (SELECT count(*) FROM hands) AS hands, "
+            "(SELECT count(*) FROM hand_participants) AS participants, "
+            "(SELECT count(*) FROM players) AS players, "
+            "(SELECT count(*) FROM actions) AS actions, "
+            "(SELECT count(*) FROM pot_winners) AS winners"
+        )).mappings().one()
+        hand_count = counts['hands']
         
         logger.info("Database contents:")
         logger.info(f"  - Hands: {hand_count}")
-        logger.info(f"  - Hand Participants: {participant_count}")
-        logger.info(f"  - Players: {player_count}")
-        logger.info(f"  - Actions: {action_count}")
-        logger.info(f"  - Winners: {winner_count}")
+        logger.info(f"  - Hand Participants: {counts['participants']}")
+        logger.info(f"  - Players: {counts['players']}")
+        logger.info(f"  - Actions: {counts['actions']}")
+        logger.info(f"  - Winners: {counts['winners']}")
         
         # List a few hands for verification
         if hand_count > 0:
-            hands = session.query(Hand).order_by(Hand.id.desc()).limit(5).all()
+            # Eagerly load the related rows of all listed hands instead of lazy loading them per hand
+            hands = session.execute(
+                select(Hand)
+                .options(
+                    selectinload(Hand.participants).selectinload(HandParticipant.player),
+                    selectinload(Hand.actions),
+                    selectinload(Hand.pots).selectinload(Pot.winners)
+                    .selectinload(PotWinner.participant).selectinload(HandParticipant.player)
+                )
+                .order_by(Hand.id.desc())
+                .limit(5)
+            ).scalars().all()
             logger.info("Recent hands:")
             for hand in hands:
+                winners = [winner for pot in hand.pots for winner in pot.winners]
                 logger.info(f"  - Hand ID: {hand.hand_id}, Tournament: {hand.tournament_id}, Game: {hand.game_type}")
-                logger.info(f"    Participants: {len(hand.participants)}, Actions: {len(hand.actions)}, Winners: {len(hand.winners)}")
+                logger.info(f"    Participants: {len(hand.participants)}, Actions: {len(hand.actions)}, Winners: {len(winners)}")
                 
                 # Show details of the first hand
                 if hand == hands[0]:
@@ -265,8 +299,8 @@ def check_db_command(args):
                     
                     # Show winners
                     logger.info("  Winners:")
-                    for w in hand.winners:
-                        logger.info(f"    - Player: {w.player_name}, Amount: {w.amount}")
+                    for w in winners:
+                        logger.info(f"    - Player: {w.participant.player.name}, Amount: {w.amount}")
         else:
             logger.info("No hands found in the database.")
     except Exception as e:
@@ -311,6 +345,7 @@ def main():
     api_parser = subparsers.add_parser("api", help="Start the API server")
     api_parser.add_argument("--host", default="localhost", help="Host for API server")
     api_parser.add_argument("--port", type=int, default=8000, help="Port for API server")
+    api_parser.add_argument("--workers", type=int, help="Number of API worker processes (default: CPU count)")
     api_parser.set_defaults(func=api_command)
     
     # Check database command
@@ -319,26 +354,17 @@ def main():
 
     args = parser.parse_args()
 
-    try:
-        if args.command == "sync":
-            sync_command(args)
-        elif args.command == "monitor":
-            monitor_command(args)
-        elif args.command == "api":
-            api_command(args)
-        elif args.command == "parse":
-            parse_command(args)
-        elif args.command == "init-db":
-            init_db_command(args)
-        else:
-            parser.print_help()
+    # Each subparser registers its command function via set_defaults
+    if not getattr(args, "func", None):
+        parser.print_help()
+        return 0
 
+    try:
+        return args.func(args) or 0
     except Exception as e:
         logger.error(f"Error in Poker Hud: {e}", exc_info=True)
         return 1
 
-    return 0
-
 
 if __name__ == "__main__":
     sys.exit(main())